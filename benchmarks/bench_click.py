@@ -0,0 +1,72 @@
+"""
+Benchmark of metronome timing: clicks mixed into audio blocks vs. clicks triggered by a Python timer thread.
+
+Usage: python -m benchmarks.bench_click [bpm]
+Mixed clicks are rendered offline block by block (as the audio callback does) and their onsets are detected
+in the output signal. Timer clicks are the wake-up times of a Ticker running at the beat rate.
+"""
+import sys
+import threading
+from time import monotonic
+
+import numpy as np
+
+from src.app.metronome import Metronome
+from src.app.timers import Ticker
+
+SAMPLE_RATE = 44100
+# same as StreamEngine.BLOCK_FRAMES
+BLOCK_FRAMES = 1024
+SECONDS = 20
+
+
+def mixed_click_onsets(bpm):
+    metronome = Metronome(SAMPLE_RATE, bpm, 4)
+    metronome.enabled = True
+    blocks = []
+    for _ in range(SECONDS * SAMPLE_RATE // BLOCK_FRAMES):
+        block = np.zeros((BLOCK_FRAMES, 2), dtype=np.float32)
+        metronome.mix(block, BLOCK_FRAMES)
+        blocks.append(block[:, 0])
+    signal = np.abs(np.concatenate(blocks)) > 0
+    # onset is the first sound after at least 10 ms of silence
+    silence = int(0.01 * SAMPLE_RATE)
+    sounding = np.flatnonzero(signal)
+    onsets = sounding[np.insert(np.diff(sounding) > silence, 0, True)]
+    # click starts with sin(0) = 0, so the detected onset is one frame late
+    return (onsets - 1) / SAMPLE_RATE
+
+
+def timer_click_onsets(bpm):
+    onsets = []
+    done = threading.Event()
+    beats = int(SECONDS * bpm / 60)
+
+    def click():
+        onsets.append(monotonic())
+        if len(onsets) >= beats:
+            done.set()
+
+    ticker = Ticker(click, bpm / 60, name='click')
+    ticker.start()
+    done.wait()
+    ticker.stop()
+    return np.array(onsets) - onsets[0]
+
+
+def report(name, onsets, interval):
+    deviation = np.abs(onsets - onsets[0] - interval * np.arange(len(onsets))) * 1000
+    print(f'{name:14} {len(onsets):>7} {deviation.mean():10.3f}ms {deviation.max():10.3f}ms')
+
+
+def main():
+    bpm = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    interval = 60 / bpm
+    print(f'{bpm} BPM, {SECONDS} s')
+    print(f'{"clicks":14} {"count":>7} {"mean dev":>12} {"max dev":>12}')
+    report('mixed', mixed_click_onsets(bpm), interval)
+    report('python timer', timer_click_onsets(bpm), interval)
+
+
+if __name__ == '__main__':
+    main()
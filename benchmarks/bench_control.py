@@ -0,0 +1,76 @@
+"""
+Benchmark of remote control latency: command sent over TCP -> UI loop event -> acknowledgement.
+
+Usage: python -m benchmarks.bench_control [redraw_ms]
+The UI loop is a thread reading window events from a queue (as window.read does) and spending
+redraw_ms (default 5) on each command before acknowledging it, the client measures the round trip.
+"""
+import json
+import queue
+import socket
+import sys
+import threading
+from time import monotonic, sleep
+
+import numpy as np
+
+from src.app.control_server import ControlServer
+
+COMMANDS = 200
+PORT = 8799
+
+
+class EventQueueWindow:
+    """Stand-in for the window: events written from other threads are read by the UI loop thread"""
+
+    def __init__(self):
+        self.events = queue.Queue()
+
+    def write_event_value(self, key, value):
+        self.events.put((key, value))
+
+
+def ui_loop(window, server, redraw_seconds, done):
+    while not done.is_set():
+        try:
+            event, (command, argument, received, client) = window.events.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        sleep(redraw_seconds)
+        server.acknowledge(client, command, monotonic() - received)
+
+
+def main():
+    redraw_seconds = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.005
+    window = EventQueueWindow()
+    server = ControlServer(window, lambda: 0.0, port=PORT)
+    server.start()
+    done = threading.Event()
+    threading.Thread(target=ui_loop, args=(window, server, redraw_seconds, done), daemon=True).start()
+
+    round_trips = []
+    with socket.create_connection((ControlServer.DEF_HOST, PORT)) as connection:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        lines = connection.makefile('rb')
+        lines.readline()
+        for _ in range(COMMANDS):
+            start = monotonic()
+            connection.sendall(b'next\n')
+            while 'ack' not in json.loads(lines.readline()):
+                pass
+            round_trips.append(monotonic() - start)
+            sleep(0.01)
+    done.set()
+    server.stop()
+
+    round_trips = np.array(round_trips) * 1000
+    count, mean_latency, max_latency = server.get_latency_stats()
+    print(f'{COMMANDS} commands, {redraw_seconds * 1000:.0f} ms redraw')
+    print(f'{"":14} {"mean":>10} {"p99":>10} {"max":>10}')
+    print(f'{"round trip":14} {round_trips.mean():8.2f}ms {np.percentile(round_trips, 99):8.2f}ms '
+          f'{round_trips.max():8.2f}ms')
+    print(f'{"to redraw":14} {mean_latency * 1000:8.2f}ms {"":>10} {max_latency * 1000:8.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
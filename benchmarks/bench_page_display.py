@@ -0,0 +1,72 @@
+"""
+Benchmark of the page display path: PNG encode + decode by Tk image vs. raw PPM data.
+
+Usage: python -m benchmarks.bench_page_display [file.pdf]
+Without arguments a synthetic, dense page (lots of text and lines) is used.
+Tk decoding is measured only if a display is available.
+"""
+import sys
+from time import perf_counter
+
+import fitz
+
+from src.app.pdf import PdfDocument
+
+PANEL_SIZES = {
+    '1080p': (760, 1050),
+    '1440p': (1010, 1400),
+    '4K': (1520, 2100),
+}
+REPEATS = 5
+
+
+def make_test_pdf():
+    pdf = fitz.open()
+    page = pdf.new_page(width=595, height=842)
+    for staff in range(12):
+        y = 60 + staff * 62
+        for line in range(5):
+            page.draw_line((40, y + line * 6), (555, y + line * 6), width=0.6)
+        for note in range(40):
+            page.draw_circle((50 + note * 12.6, y + (note * 7) % 24), 2.8, fill=(0, 0, 0))
+    page.insert_text((40, 40), 'Benchmark page ' * 4, fontsize=14)
+    return pdf
+
+
+def measure(fn):
+    best = None
+    for _ in range(REPEATS):
+        start = perf_counter()
+        fn()
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def main():
+    pdf = fitz.open(sys.argv[1]) if len(sys.argv) > 1 else make_test_pdf()
+    page = pdf[0]
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as ex:
+        print(f'No display, measuring encoding only ({ex})')
+        tk = None
+
+    print(f'{"panel":8} {"png encode":>12} {"png decode":>12} {"ppm encode":>12} {"ppm decode":>12} {"saved":>10}')
+    for name, (width, height) in PANEL_SIZES.items():
+        pixmap = page.get_pixmap(dpi=int(PdfDocument.PDF_DPI * height / page.rect.height), alpha=False)
+        png = pixmap.tobytes('png')
+        ppm = PdfDocument.to_image_data(pixmap)
+        png_encode = measure(lambda: pixmap.tobytes('png'))
+        ppm_encode = measure(lambda: PdfDocument.to_image_data(pixmap))
+        png_decode = measure(lambda: tk.PhotoImage(data=png)) if tk else 0.0
+        ppm_decode = measure(lambda: tk.PhotoImage(data=ppm)) if tk else 0.0
+        saved = (png_encode + png_decode) - (ppm_encode + ppm_decode)
+        print(f'{name:8} {png_encode:10.1f}ms {png_decode:10.1f}ms {ppm_encode:10.1f}ms {ppm_decode:10.1f}ms '
+              f'{saved:8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark of automatic page turn timing: PageTurner scheduler vs. checking the timeline on progress updates.
+
+Usage: python -m benchmarks.bench_page_turn [speed]
+Player position is simulated with a clock advancing in audio blocks (as the engine position does).
+Latency is the time from the timeline timestamp of a turn to the turn callback. Progress updates check
+the timeline at the default progress rate of the application.
+"""
+import bisect
+import sys
+import threading
+from time import monotonic
+
+import numpy as np
+
+from src.app.page_turner import PageTurner
+from src.app.timers import Ticker
+
+SAMPLE_RATE = 44100
+# same as StreamEngine.BLOCK_FRAMES
+BLOCK_FRAMES = 1024
+# same as Application.PROGRESS_RATE
+PROGRESS_RATE = 20
+TURNS = 20
+TURN_INTERVAL = 0.7
+
+
+class SimulatedPlayer:
+
+    def __init__(self, speed):
+        self.speed = speed
+        self.__start = monotonic()
+
+    def get_position(self):
+        """Track position, updated once per played block"""
+        played_frames = int((monotonic() - self.__start) * SAMPLE_RATE) // BLOCK_FRAMES * BLOCK_FRAMES
+        return played_frames / SAMPLE_RATE * self.speed
+
+    def get_speed(self):
+        return self.speed
+
+
+def timeline():
+    return [[TURN_INTERVAL * (n + 1), 2 * (n + 1)] for n in range(TURNS)]
+
+
+def scheduler_latencies(speed):
+    player = SimulatedPlayer(speed)
+    latencies = []
+    prerender_leads = []
+    done = threading.Event()
+
+    def on_turn(page, target):
+        if target is not None:
+            latencies.append((player.get_position() - target) / speed)
+            if len(latencies) >= TURNS:
+                done.set()
+
+    def on_prerender(page):
+        prerender_leads.append((page / 2 * TURN_INTERVAL - player.get_position()) / speed)
+
+    turner = PageTurner(timeline(), 0, player.get_position, player.get_speed, on_prerender, on_turn, lead_time=0.5)
+    turner.start()
+    done.wait()
+    turner.stop()
+    return np.array(latencies), np.array(prerender_leads)
+
+
+def progress_latencies(speed):
+    player = SimulatedPlayer(speed)
+    times = [seconds for seconds, _ in timeline()]
+    latencies = []
+    done = threading.Event()
+    shown = [-1]
+
+    def update_progress():
+        position = player.get_position()
+        index = bisect.bisect_right(times, position) - 1
+        if index > shown[0]:
+            latencies.append((position - times[index]) / speed)
+            shown[0] = index
+            if len(latencies) >= TURNS:
+                done.set()
+
+    ticker = Ticker(update_progress, PROGRESS_RATE, name='progress')
+    ticker.start()
+    done.wait()
+    ticker.stop()
+    return np.array(latencies)
+
+
+def report(name, latencies):
+    print(f'{name:18} {len(latencies):>7} {latencies.mean() * 1000:10.1f}ms {latencies.max() * 1000:10.1f}ms')
+
+
+def main():
+    speed = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    print(f'{TURNS} turns every {TURN_INTERVAL} s of the track, speed {speed}')
+    print(f'{"turns":18} {"count":>7} {"mean lat":>12} {"max lat":>12}')
+    latencies, prerender_leads = scheduler_latencies(speed)
+    report('scheduler', latencies)
+    report(f'progress {PROGRESS_RATE} Hz', progress_latencies(speed))
+    print(f'prerender requested {prerender_leads.min() * 1000:.0f} ms or more ahead of the turn')
+
+
+if __name__ == '__main__':
+    main()
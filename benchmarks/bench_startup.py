@@ -0,0 +1,99 @@
+"""
+Benchmark of the application start-up: import times, time to the main window and to the first rendered PDF.
+
+Usage: python -m benchmarks.bench_startup [entry_code]
+Import times are taken from `python -X importtime` of a fresh interpreter, modules which should be loaded
+only on the first PDF or track (PyMuPDF, numpy, audio, asyncio) are reported if they're imported at start-up.
+Time to window (and to the first render of the entry's PDF, if the code is given) is measured by running
+the application in a child process, so it needs a display and the database.
+"""
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+# loaded on first use, importing them at start-up is a regression
+DEFERRED_MODULES = ('fitz', 'pymupdf', 'numpy', 'sounddevice', 'soundfile', 'asyncio', 'mido')
+TOP_IMPORTS = 10
+CHILD_TIMEOUT = 60
+
+
+def import_times():
+    """Returns (self, cumulative) import times in seconds by module name and top level module names"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import src.app.application'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise Exception(result.stderr.strip().splitlines()[-1])
+    times = {}
+    top_level = []
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us) / 1e6, int(cumulative_us) / 1e6)
+        # nested imports are listed before the importing module, indented by 2 spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            children.append(name.strip())
+        elif depth == 0:
+            if name.strip() == 'src.app.application':
+                top_level = children
+            children = []
+    return times, top_level
+
+
+def report_imports():
+    times, top_level = import_times()
+    print(f'import src.app.application: {times["src.app.application"][1] * 1000:.1f} ms')
+    print(f'{"module":32} {"cumulative":>12}')
+    for name in sorted(top_level, key=lambda module: -times[module][1])[:TOP_IMPORTS]:
+        print(f'{name:32} {times[name][1] * 1000:10.1f}ms')
+    imported = [name for name in DEFERRED_MODULES if name in times]
+    if imported:
+        print(f'REGRESSION - imported at start-up: {", ".join(imported)}')
+    else:
+        print(f'deferred: {", ".join(DEFERRED_MODULES)}')
+
+
+def report_window(entry_code):
+    start = perf_counter()
+    child = subprocess.Popen([sys.executable, '-m', 'benchmarks.bench_startup', '--child'] +
+                             ([entry_code] if entry_code else []), stdout=subprocess.PIPE, text=True)
+    try:
+        stages = 0
+        for line in child.stdout:
+            print(f'time to {line.strip():14} {(perf_counter() - start) * 1000:8.1f} ms')
+            stages += 1
+        child.wait(CHILD_TIMEOUT)
+        if not stages:
+            print('the application didn\'t start (a display and the database are needed)')
+    finally:
+        child.kill()
+
+
+def run_child(entry_code):
+    from src.app.application import Application
+
+    def on_startup(stage, window):
+        print(stage, flush=True)
+        if stage == 'window' and entry_code:
+            window.write_event_value(Application.EVENT_RUN_ENTRY, entry_code)
+        elif stage == 'window' or stage == 'first_render':
+            # exit at once, closing the window, audio and caches isn't measured
+            os._exit(0)
+
+    Application(on_startup=on_startup).run()
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2] if len(sys.argv) > 2 else None)
+        return
+    entry_code = sys.argv[1] if len(sys.argv) > 1 else None
+    report_imports()
+    report_window(entry_code)
+
+
+if __name__ == '__main__':
+    main()
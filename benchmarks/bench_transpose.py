@@ -0,0 +1,67 @@
+"""
+Benchmark of the streaming pitch transposition and tempo change: processing time vs. real time of the audio.
+
+Usage: python -m benchmarks.bench_transpose [file.wav|file.mp3]
+Without arguments 30 seconds of synthetic stereo chords is used.
+Processing runs in one thread (NumPy FFT is single threaded), chunks have the size used by the player.
+"""
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from src.app.audio_dsp import PitchTempoShifter
+
+SAMPLE_RATE = 44100
+SETTINGS = [(-12, 1.0), (-5, 1.0), (-2, 1.0), (2, 1.0), (5, 1.0), (12, 1.0),
+            (0, 0.5), (0, 0.7), (0, 0.8), (0, 1.25), (5, 0.7), (-2, 0.8)]
+REPEATS = 3
+# same as StreamEngine.CHUNK_FRAMES
+CHUNK_FRAMES = 4096
+
+
+def make_test_audio(seconds=30):
+    t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+    chord = sum(np.sin(2 * np.pi * freq * t) for freq in (220.0, 277.2, 329.6, 415.3)) / 4
+    noise = np.random.default_rng(1).normal(0, 0.05, len(t))
+    return np.stack((chord + noise, chord - noise), axis=1).astype(np.float32), SAMPLE_RATE
+
+
+def load_audio(path):
+    import soundfile as sf
+    samples, sample_rate = sf.read(path, dtype='float32', always_2d=True)
+    return samples, sample_rate
+
+
+def measure(samples, semitones, speed):
+    best = None
+    for _ in range(REPEATS):
+        shifter = PitchTempoShifter(samples.shape[1], semitones, speed)
+        worst_chunk = 0.0
+        start = perf_counter()
+        for pos in range(0, len(samples), CHUNK_FRAMES):
+            chunk_start = perf_counter()
+            shifter.process(samples[pos:pos + CHUNK_FRAMES], pos)
+            worst_chunk = max(worst_chunk, perf_counter() - chunk_start)
+        elapsed = perf_counter() - start
+        if best is None or elapsed < best[0]:
+            best = (elapsed, worst_chunk)
+    return best
+
+
+def main():
+    samples, sample_rate = load_audio(sys.argv[1]) if len(sys.argv) > 1 else make_test_audio()
+    duration = len(samples) / sample_rate
+    chunk_duration = CHUNK_FRAMES / sample_rate
+    print(f'{duration:.1f} s of audio, {samples.shape[1]} channels, {sample_rate} Hz, '
+          f'chunk {chunk_duration * 1000:.1f} ms')
+    print(f'{"semitones":>10} {"speed":>6} {"total":>10} {"real time x":>12} {"worst chunk":>12}')
+    for semitones, speed in SETTINGS:
+        elapsed, worst_chunk = measure(samples, semitones, speed)
+        # played time is longer than the source when slowed down
+        real_time = duration / speed / elapsed
+        print(f'{semitones:>+10} {speed:6.2f} {elapsed:9.2f}s {real_time:11.1f}x {worst_chunk * 1000:10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
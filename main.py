@@ -1,8 +1,67 @@
-from src.app.application import Application
+import argparse
+
+from src.app.documents import Documents
 
 """
 Main module to run the application 
 """
 if __name__ == '__main__':
-    app = Application()
-    app.run()
+    parser = argparse.ArgumentParser(description='Music Practice Helper')
+    parser.add_argument('--import-json', nargs=2, metavar=('JSON_FILE', 'DB_FILE'),
+                        help='create SQLite database from json file and exit')
+    parser.add_argument('--export-json', nargs=2, metavar=('DB_FILE', 'JSON_FILE'),
+                        help='export SQLite database to json file and exit')
+    parser.add_argument('--warm-cache', action='store_true',
+                        help='pre-render first pages of all PDF entries into the render cache and exit')
+    parser.add_argument('--view-size', metavar='WIDTHxHEIGHT',
+                        help='PDF page size in pixels for --warm-cache (default: last size used by the application)')
+    parser.add_argument('--spreads', type=int, default=1, help='number of page spreads to pre-render')
+    parser.add_argument('--analyze-loudness', action='store_true',
+                        help='analyze loudness of audio files of all entries (only new or changed files) and exit')
+    parser.add_argument('--scan-library', action='store_true',
+                        help='find PDF and audio files under the configured paths not used by any entry, '
+                             'propose new entries and exit')
+    parser.add_argument('--add', action='store_true', help='add entries proposed by --scan-library')
+    parser.add_argument('--build-search-index', action='store_true',
+                        help='index text of PDF files of all entries (only new or changed files) and exit')
+    parser.add_argument('--check-library', action='store_true',
+                        help='list entries whose PDF or audio files are missing and exit')
+    parser.add_argument('--processes', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+    if args.import_json:
+        Documents.import_json(*args.import_json)
+    elif args.export_json:
+        Documents.export_json(*args.export_json)
+    elif args.warm_cache:
+        # modules of batch commands (and the application) are imported only when used, to keep start-up fast
+        from src.app.warm_cache import warm_cache
+        documents = Documents()
+        documents.load()
+        view_size = tuple(int(size) for size in args.view_size.split('x')) if args.view_size else None
+        warm_cache(documents, view_size=view_size, spreads=args.spreads, processes=args.processes)
+    elif args.scan_library:
+        from src.app.library_scanner import scan_library
+        documents = Documents()
+        documents.load()
+        scan_library(documents, add=args.add)
+        documents.close()
+    elif args.check_library:
+        from src.app.library_health import check_library
+        documents = Documents()
+        documents.load()
+        check_library(documents)
+        documents.close()
+    elif args.build_search_index:
+        from src.app.search_index import build_search_index
+        documents = Documents()
+        documents.load()
+        build_search_index(documents, processes=args.processes)
+    elif args.analyze_loudness:
+        from src.app.loudness import analyze_library
+        documents = Documents()
+        documents.load()
+        analyze_library(documents, processes=args.processes)
+    else:
+        from src.app.application import Application
+        app = Application()
+        app.run()
@@ -1,36 +1,22 @@
-from time import sleep
+import threading
+from time import monotonic
 
 import PySimpleGUI as sg
 
 from . import __version__
+from .control_server import ControlServer
+from .disk_cache import DiskRenderCache
 from .documents import Documents
 from .entry_editor import EntryEditor
+from .library_health import LibraryHealthCheck
+from .page_turner import PageTurner
 from .pdf import PdfDocument
 from .player import Player
-
-
-class ThreadUpdater:
-    """
-        Thread that sends in regular periods notification to update progress bar
-    """
-
-    def __init__(self, window):
-        self.started = False
-        self.terminated = False
-        self.window = window
-
-    def stop(self, wait_to_finish=True):
-        self.terminated = True
-        if not wait_to_finish:
-            return
-        while self.started:
-            sleep(1)
-
-    def run(self):
-        while not self.terminated:
-            self.window.write_event_value('UPDATE_PROGRESS', value=None)
-            sleep(1)
-        self.started = False
+from .prepare import PreparePipeline
+from .render_cache import PrefetchWorker, RenderCache
+from .search_index import SearchIndex
+from .setlist import PreloadedEntry, Setlist
+from .timers import Debouncer, Ticker
 
 
 class Application:
@@ -42,19 +28,67 @@ class Application:
     LIST_ALTO = "TAG_ALTO"
     LIST_TENOR = "TAG_TENOR"
     AUDIO_WAIT = 3
+    COUNT_IN_BARS = 1
+    TIME_SIGNATURES = ['2/4', '3/4', '4/4', '5/4', '6/8', '7/8', '12/8']
+    # progress bar updates per second
+    PROGRESS_RATE = 20
     LIST_FILTER_ALL = 'list_filter_all'
     LIST_FILTER_AUDIO_ONLY = 'list_filter_audio_only'
     LIST_FILTER_PDF_ONLY = 'list_filter_pdf_only'
     LIST_AUDIO_PDF = 'list_audio_pdf'
+    EVENT_PDF_REFINED = 'PDF_REFINED'
+    EVENT_CONFIGURE = 'WINDOW_CONFIGURE'
+    EVENT_RESIZE_SETTLED = 'RESIZE_SETTLED'
+    EVENT_WAVEFORM = 'WAVEFORM_READY'
+    EVENT_PAGE_PRERENDER = 'PAGE_PRERENDER'
+    EVENT_PAGE_TURN = 'PAGE_TURN'
+    EVENT_PRELOADED = 'SETLIST_PRELOADED'
+    EVENT_HEALTH_CHECKED = 'LIBRARY_HEALTH_CHECKED'
+    # runs the entry with the code given as the event value
+    EVENT_RUN_ENTRY = 'RUN_ENTRY'
+    WAVEFORM_HEIGHT = 60
+    WAVEFORM_COLOR = '#8fb3d9'
+    # sharp re-render is done when window size doesn't change for this time (in seconds)
+    RESIZE_SETTLE_DELAY = 0.3
+    # minimal time between resampled previews while resizing
+    RESIZE_PREVIEW_INTERVAL = 0.1
 
-    def __init__(self):
+    def __init__(self, on_startup=None):
+        # called with (stage, window) when the window is shown ('window') and the first PDF is rendered
+        # ('first_render'), used by the start-up benchmark
+        self.__on_startup = on_startup
+        self.__is_first_render = True
         self.__documents = None
         self.__player = Player()
         self.__pdf = None
+        self.__render_cache = RenderCache()
+        self.__disk_cache = DiskRenderCache()
+        # created on the first track, it loads numpy and soundfile
+        self.__waveform_cache = None
+        self.__waveform_worker = PrefetchWorker(name='waveform')
+        self.__waveform_path = None
+        self.__waveform_cursor = None
+        self.__search_index = SearchIndex()
+        self.__timeline = None
+        self.__page_turner = None
+        self.__setlist = Setlist()
+        self.__preloaded = None
+        self.__preload_worker = PrefetchWorker(name='setlist-preload')
+        self.__control = None
+        self.__saved_view_size = None
+        self.__pdf_generation = 0
+        self.__shown_pages = []
+        # shown pages scaled down to draft resolution, resampled for previews while resizing
+        self.__resize_drafts = None
+        self.__shown_view_size = None
+        self.__last_resize_preview = 0
+        self.__resize_debouncer = None
         self.__main_window = None
         self.__progress_thread = None
+        self.__prepare = None
         self.__is_playing = False
         self.__is_pause = False
+        self.__loop_start = None
         self.__DPI = 90
 
     def run(self):
@@ -62,10 +96,29 @@ class Application:
         self.__load_documents()
         items = self.__documents.get_entries()
         self.__build_main_window(items)
+        self.__main_window.refresh()
+        if self.__on_startup is not None:
+            self.__on_startup('window', self.__main_window)
+        # index of PDF text (built with --build-search-index) is loaded in the background, once the window is shown
+        threading.Thread(target=self.__search_index.load, name='search-index', daemon=True).start()
+        # entries with missing files are flagged in the list once the check is done
+        window = self.__main_window
+        LibraryHealthCheck(self.__documents).start(
+            lambda missing: window.write_event_value(Application.EVENT_HEALTH_CHECKED, missing))
+        self.__start_control()
         self.__ui_loop()
+        if self.__control is not None:
+            self.__control.stop()
+        self.__cancel_prepare()
+        if self.__progress_thread:
+            self.__progress_thread.stop()
+        self.__waveform_worker.stop()
+        self.__drop_preloaded()
+        self.__preload_worker.stop()
         self.__player.stop()
         self.__main_window.close()
         self.__stop_player()
+        self.__documents.close()
 
     def __load_documents(self):
         self.__documents = Documents()
@@ -75,6 +128,14 @@ class Application:
         # sg.theme("Default 1")
         sg.set_options(font='Arial 14')
         listbox = sg.Listbox(items, expand_x=True, expand_y=True)
+        input_search = sg.Input('', key='SearchText', expand_x=True)
+        btn_find = sg.Button('Find', size=(10, 1), auto_size_button=False, bind_return_key=True)
+        listbox_hits = sg.Listbox([], key='SearchHits', enable_events=True, size=(20, 4), expand_x=True)
+        btn_queue = sg.Button('Queue', size=(10, 1), auto_size_button=False)
+        btn_unqueue = sg.Button('Remove', key='Unqueue', size=(10, 1), auto_size_button=False)
+        btn_play_list = sg.Button('Play list', key='PlayList', size=(10, 1), auto_size_button=False)
+        btn_skip = sg.Button('Skip', key='SkipEntry', disabled=True, size=(10, 1), auto_size_button=False)
+        listbox_setlist = sg.Listbox([], key='Setlist', size=(20, 4), expand_x=True)
         rd_all = sg.Radio('all', 'list_filter', key=Application.LIST_FILTER_ALL, default=True,
                           enable_events=True)
         rd_audio_only = sg.Radio('audio only', 'list_filter', key=Application.LIST_FILTER_AUDIO_ONLY,
@@ -87,10 +148,21 @@ class Application:
         rd_tenor = sg.Radio('Tenor', 'tag_filter', key=Application.LIST_TENOR, enable_events=True)
         console = sg.Multiline("", disabled=True, autoscroll=True, write_only=False, size=(20, 5),
                                expand_x=True, expand_y=False)
-        progress_bar = sg.ProgressBar(size=(10,15), expand_x=True, max_value=0)
         btn_run = sg.Button('Run', size=(10, 1), auto_size_button=False)
         btn_pause = sg.Button('Pause', disabled=True, size=(10, 1), auto_size_button=False)
         btn_stop = sg.Button('Stop', disabled=True, size=(10, 1), auto_size_button=False)
+        btn_loop_a = sg.Button('A', key='LoopA', disabled=True, size=(3, 1), auto_size_button=False)
+        btn_loop_b = sg.Button('B', key='LoopB', disabled=True, size=(3, 1), auto_size_button=False)
+        btn_loop_off = sg.Button('Loop off', key='LoopOff', disabled=True, size=(8, 1), auto_size_button=False)
+        spin_transpose = sg.Spin(list(range(-12, 13)), initial_value=0, key='Transpose', enable_events=True,
+                                 disabled=True, size=(3, 1))
+        chk_click = sg.Checkbox('Click', key='Click', enable_events=True)
+        spin_bpm = sg.Spin(list(range(30, 301)), initial_value=120, key='Bpm', enable_events=True, size=(4, 1))
+        combo_signature = sg.Combo(Application.TIME_SIGNATURES, default_value='4/4', key='TimeSignature',
+                                   readonly=True, enable_events=True, size=(5, 1))
+        chk_count_in = sg.Checkbox('Count-in', key='CountIn')
+        spin_speed = sg.Spin(list(range(50, 155, 5)), initial_value=100, key='Speed', enable_events=True,
+                             size=(4, 1))
         btn_up = sg.Button('⬆️', key='Up', disabled=True, size=(5, 1), auto_size_button=False)
         btn_down = sg.Button('⬇️', key='Down', disabled=True, size=(5, 1), auto_size_button=False)
         btn_zoom_in = sg.Button('➕', key='ZoomIn', disabled=True, size=(5, 1), auto_size_button=False)
@@ -101,6 +173,10 @@ class Application:
 
         win_size = sg.Window.get_screen_size()
         win_size = (win_size[0] - 30, win_size[1] - 70)
+        # waveform overview of the track, used also as a progress bar and to seek
+        waveform = sg.Graph(canvas_size=(int(0.35 * win_size[0]), Application.WAVEFORM_HEIGHT),
+                            graph_bottom_left=(0, -1), graph_top_right=(1, 1), background_color='white',
+                            key='Waveform', enable_events=True)
 
         controls_column = sg.Column(layout=[
             [sg.Text('Pickup any song/tune from the list')],
@@ -108,8 +184,15 @@ class Application:
             [sg.Text('Tags:'), rd_any_tag, rd_alto, rd_tenor],
             [btn_add_new, btn_edit],
             [listbox],
+            [sg.Text('Find in PDF:'), input_search, btn_find],
+            [listbox_hits],
+            [sg.Text('Setlist:'), sg.Push(), btn_queue, btn_unqueue, btn_play_list, btn_skip],
+            [listbox_setlist],
             [console],
-            [progress_bar],
+            [waveform],
+            [sg.Text('Loop:'), btn_loop_a, btn_loop_b, btn_loop_off, sg.Push(), sg.Text('Transpose:'), spin_transpose,
+             sg.Text('Speed %:'), spin_speed],
+            [chk_click, sg.Text('BPM:'), spin_bpm, combo_signature, chk_count_in],
             [btn_run, btn_pause, btn_stop, sg.Push(), btn_zoom_in, btn_zoom_out, btn_up, btn_down]
         ], expand_x=True, expand_y=True, pad=(0, 0), vertical_alignment='top')
 
@@ -135,31 +218,42 @@ class Application:
         window.rd_alto = rd_alto
         window.rd_tenor = rd_tenor
         window.listbox = listbox
+        window.input_search = input_search
+        window.listbox_hits = listbox_hits
+        window.listbox_setlist = listbox_setlist
+        window.btn_skip = btn_skip
         window.console = console
         window.btn_stop = btn_stop
         window.btn_pause = btn_pause
+        window.btn_loop_a = btn_loop_a
+        window.btn_loop_b = btn_loop_b
+        window.btn_loop_off = btn_loop_off
+        window.spin_transpose = spin_transpose
+        window.spin_speed = spin_speed
+        window.chk_click = chk_click
+        window.spin_bpm = spin_bpm
+        window.combo_signature = combo_signature
+        window.chk_count_in = chk_count_in
         window.btn_up = btn_up
         window.btn_down = btn_down
         window.btn_zoom_in = btn_zoom_in
         window.btn_zoom_out = btn_zoom_out
         window.btn_edit = btn_edit
         window.btn_add_new = btn_add_new
-        window.progress_bar = progress_bar
+        window.waveform = waveform
         window.img_pdf1 = img_pdf1
         window.img_pdf2 = img_pdf2
         window.frame1 = controls_column
         window.frame2 = pdfs_column
+        window.bind('<Configure>', Application.EVENT_CONFIGURE)
         self.__main_window = window
+        self.__resize_debouncer = Debouncer(Application.RESIZE_SETTLE_DELAY,
+                                            lambda: window.write_event_value(Application.EVENT_RESIZE_SETTLED, None))
 
 
         return window
 
-    def __show_pdf_pages(self):
-        pdf = self.__pdf
-        if pdf is None:
-            return
-        img_pdf1 = self.__main_window.img_pdf1
-        img_pdf2 = self.__main_window.img_pdf2
+    def __pdf_view_size(self):
         win_width, win_height = self.__main_window.size
         panel_width, panel_height = self.__main_window.listbox.get_size()
         win_width = max(10, win_width - panel_width - 30)
@@ -169,51 +263,548 @@ class Application:
         # crop PDF width and height to keep A4 page ratio
         pdf_height = min(pdf_height, int(pdf_width * 1.414))
         pdf_width = min(pdf_width, int(pdf_height / 1.414))
-        img_x, img_y = pdf_width, pdf_height
-        png = pdf.get_pdf_page((img_x, img_y))
-        img_pdf1.update(data=png.tobytes())
-        if (pdf.current_page_num() + 1) < len(pdf):
-            png = pdf.get_pdf_page((img_x, img_y), page_offset=1)
+        return pdf_width, pdf_height
+
+    def __show_pdf_pages(self, keep_preview=False):
+        pdf = self.__pdf
+        if pdf is None:
+            return
+        self.__pdf_generation += 1
+        self.__publish_state()
+        images = [self.__main_window.img_pdf1, self.__main_window.img_pdf2]
+        page_offsets = [0, 1] if (pdf.current_page_num() + 1) < len(pdf) else [0]
+        view_size = self.__pdf_view_size()
+        is_complete = True
+        shown_pages = []
+        for image, page_offset in zip(images, page_offsets):
+            png = pdf.get_pdf_page(view_size, page_offset=page_offset, cached_only=True)
             if png is not None:
-                img_pdf2.update(data=png.tobytes())
+                image.update(data=PdfDocument.to_image_data(png))
+                shown_pages.append(png)
+            elif keep_preview:
+                # resampled preview stays visible until the full resolution page is ready
+                is_complete = False
+            else:
+                # show low resolution draft at once, full resolution page is rendered in the background
+                png = pdf.get_draft_page(view_size, page_offset=page_offset)
+                image.update(data=PdfDocument.to_image_data(png), zoom=PdfDocument.DRAFT_ZOOM)
+                is_complete = False
+        if is_complete:
+            self.__shown_pages = shown_pages
+            self.__resize_drafts = None
+            self.__shown_view_size = view_size
+            if self.__is_first_render and self.__on_startup is not None:
+                self.__is_first_render = False
+                self.__on_startup('first_render', self.__main_window)
+            pdf.prefetch(view_size, step=2)
+            if view_size != self.__saved_view_size:
+                # the size is used by cache warm-up
+                self.__disk_cache.save_view_size(view_size)
+                self.__saved_view_size = view_size
+        else:
+            if not keep_preview:
+                self.__shown_pages = []
+                self.__resize_drafts = None
+            generation = self.__pdf_generation
+            pdf.refine(view_size, lambda: self.__main_window.write_event_value(Application.EVENT_PDF_REFINED,
+                                                                               generation))
+        return is_complete
 
-    def __load_pdf(self, file_path: str, start_page_num: int):
-        self.__pdf = PdfDocument(file_path)
-        self.__pdf.go_to_page(start_page_num)
-        self.__show_pdf_pages()
+    def __on_configure(self):
+        """Window moved or resized, while resizing the shown pages are only resampled"""
+        if self.__pdf is None or not self.__shown_pages:
+            return
+        view_size = self.__pdf_view_size()
+        if view_size == self.__shown_view_size:
+            return
+        self.__resize_debouncer.trigger()
+        now = monotonic()
+        if now - self.__last_resize_preview < Application.RESIZE_PREVIEW_INTERVAL:
+            return
+        self.__last_resize_preview = now
+        if self.__resize_drafts is None:
+            # resampling full resolution pages costs nearly as much as rendering them, previews are resampled
+            # from drafts made once per resize and zoomed by the image widget, like draft pages
+            self.__resize_drafts = [PdfDocument.resample(png, 1 / PdfDocument.DRAFT_ZOOM)
+                                    for png in self.__shown_pages]
+        scale = view_size[1] / self.__shown_view_size[1]
+        images = [self.__main_window.img_pdf1, self.__main_window.img_pdf2]
+        for image, draft in zip(images, self.__resize_drafts):
+            image.update(data=PdfDocument.to_image_data(PdfDocument.resample(draft, scale)),
+                         zoom=PdfDocument.DRAFT_ZOOM)
+
+    def __close_pdf(self):
+        self.__shown_pages = []
+        self.__resize_drafts = None
+        if self.__pdf is not None:
+            self.__pdf.close()
+            self.__pdf = None
+
+    def __open_pdf(self, pipeline, doc_path, start_page_num, view_size, render_mode):
+        expanded_path = pipeline.step('resolve pdf path', self.__documents.expand_path, doc_path)
+        pdf = pipeline.step('open pdf', PdfDocument, expanded_path, self.__render_cache, render_mode,
+                            disk_cache=self.__disk_cache)
+        pdf.go_to_page(start_page_num)
+        pipeline.step('render pdf', self.__render_spread, pdf, view_size)
+        return pdf
+
+    @staticmethod
+    def __render_spread(pdf, view_size):
+        pdf.get_pdf_page(view_size)
+        pdf.get_pdf_page(view_size, page_offset=1)
+
+    def __open_audio(self, pipeline, audio_path, semitones, speed):
+        expanded_path = pipeline.step('resolve audio path', self.__documents.expand_path, audio_path)
+        if pipeline.is_cancelled():
+            return None
+        # opened on its own engine, the pipeline hands it over to the player only if it's not cancelled
+        track = pipeline.step('open audio', self.__player.preload, expanded_path, semitones, speed)
+        if not pipeline.is_cancelled():
+            self.__waveform_path = expanded_path
+            self.__waveform_worker.submit([lambda: self.__load_waveform(expanded_path)])
+        return track
+
+    def __load_waveform(self, path):
+        # peaks are computed only for new or changed files
+        if self.__waveform_cache is None:
+            from .waveform import WaveformCache
+            self.__waveform_cache = WaveformCache()
+        peaks = self.__waveform_cache.get_or_compute(path)
+        self.__main_window.write_event_value(Application.EVENT_WAVEFORM, (path, peaks))
+
+    def __show_waveform(self, path, peaks):
+        if path != self.__waveform_path:
+            # track was changed in the meantime
+            return
+        graph = self.__main_window.waveform
+        graph.erase()
+        length = max(1, self.__player.get_len_ms())
+        graph.change_coordinates((0, -1), (length, 1))
+        width = graph.CanvasSize[0]
+        from .waveform import WaveformCache
+        low, high = WaveformCache.columns(peaks, width)
+        upper = [(column * length / width, high[column]) for column in range(width)]
+        lower = [(column * length / width, low[column]) for column in reversed(range(width))]
+        graph.draw_polygon(upper + lower, fill_color=Application.WAVEFORM_COLOR,
+                           line_color=Application.WAVEFORM_COLOR)
+        self.__waveform_cursor = None
+        self.__update_progress()
 
-    def __run_doc(self, doc_path, start_page_num: int):
-        expanded_path = self.__documents.expand_path(doc_path)
-        self.__load_pdf(expanded_path, start_page_num)
+    def __seek(self, position_ms):
+        if not self.__is_playing or self.__player.get_len_ms() == 0:
+            return
+        self.__player.seek(position_ms / 1000)
+        if self.__page_turner is not None:
+            self.__page_turner.wake()
+        self.__update_progress()
 
-    def __run_process(self, code):
+    def __run_process(self, code, page_num=None):
+        self.__cancel_prepare()
         self.__stop_player()
-        if code not in self.__documents.get_items().keys():
+        document = self.__documents.get_item(code)
+        if document is None:
             print('Cannot find document')
             return
-        document = self.__documents.get_items()[code]
+        # fail at once, not after the preparation wait
+        missing = self.__documents.find_missing(document)
+        if missing:
+            raise Exception(f'Missing file: {missing[0]}')
+        self.__close_pdf()
+        self.__clear_waveform()
         self.__main_window.img_pdf1.update(data=None)
         self.__main_window.img_pdf2.update(data=None)
 
+        pdf_task = None
+        audio_task = None
+        self.__timeline = None
         if 'pdf' in document.keys() and len(document['pdf'])>0:
             doc_path = document['pdf']
             start_page_num = document['page_num'] if 'page_num' in document else 0
+            if page_num is not None:
+                start_page_num = page_num
+            view_size = self.__pdf_view_size()
+            render_mode = document.get('render_mode') or \
+                self.__documents.get_setting('render_mode', PdfDocument.RENDER_AUTO)
             self.__main_window.console.print('Opening PDF: {}'.format(doc_path))
-            self.__run_doc(doc_path, start_page_num)
+            pdf_task = lambda pipeline: self.__open_pdf(pipeline, doc_path, start_page_num, view_size, render_mode)
+            if document.get('timeline') and document.get('audio'):
+                self.__timeline = (document['timeline'], start_page_num)
+
+        window = self.__main_window
+        count_in_bars = self.__apply_entry_settings(document)
 
         if 'audio' in document.keys() and len(document['audio'])>0:
-            self.__main_window.console.print('Preparation wait ({} seconds)...'.format(Application.AUDIO_WAIT))
-            self.__main_window.refresh()
-            sleep(Application.AUDIO_WAIT)
-            audio_path = self.__documents.expand_path(document['audio'])
+            audio_path = document['audio']
+            semitones = document.get('transpose', 0)
+            if not count_in_bars:
+                self.__main_window.console.print('Preparation wait ({} seconds)...'.format(Application.AUDIO_WAIT))
+            # practice speed is kept between entries
+            speed = int(self.__main_window.spin_speed.get()) / 100
+            audio_task = lambda pipeline: self.__open_audio(pipeline, audio_path, semitones, speed)
+        elif window.chk_click.get():
+            # metronome only
+            self.__player.start()
+
+        # count-in is played by the audio engine, so it replaces the lead-in wait
+        lead_in = 0 if count_in_bars else Application.AUDIO_WAIT
+        self.__prepare = PreparePipeline(self.__main_window, lead_in)
+        self.__prepare.start(pdf_task, audio_task,
+                             on_start=lambda track: self.__player.start_preloaded(track, count_in_bars))
+        self.__is_playing = True
+
+    def __apply_entry_settings(self, document):
+        """Shows tempo and transposition of the entry, returns the number of count-in bars"""
+        window = self.__main_window
+        if 'bpm' in document:
+            window.spin_bpm.update(value=document['bpm'])
+        if 'time_signature' in document:
+            window.combo_signature.update(value=document['time_signature'])
+        if document.get('audio'):
+            window.spin_transpose.update(value=document.get('transpose', 0))
+        self.__player.set_click(*self.__click_settings())
+        return Application.COUNT_IN_BARS if window.chk_count_in.get() else 0
+
+    def __cancel_prepare(self):
+        if self.__prepare is not None:
+            self.__prepare.cancel()
+            self.__prepare = None
+
+    def __on_prepare_event(self, event, value):
+        pipeline, result = value
+        if pipeline is not self.__prepare:
+            # outdated event of cancelled preparation
+            if event == PreparePipeline.EVENT_PDF_READY:
+                result.close()
+            return
+        console = self.__main_window.console
+        if event == PreparePipeline.EVENT_PDF_READY:
+            self.__close_pdf()
+            self.__pdf = result
+            self.__show_pdf_pages()
+        elif event == PreparePipeline.EVENT_COUNTDOWN:
+            console.print(f'{result}...')
+        elif event == PreparePipeline.EVENT_ERROR:
+            self.__prepare = None
+            self.__stop_item()
+            sg.popup(f'Error {result}')
+        elif event == PreparePipeline.EVENT_DONE:
+            self.__prepare = None
+            console.print('Prepared in: ' + ', '.join(f'{name} {int(1000 * duration)} ms'
+                                                     for name, duration in result.items()))
+            self.__start_progress()
+            self.__start_page_turner()
+            self.__preload_next()
+
+    def __start_progress(self):
+        window = self.__main_window
+        window.console.print('In progress...')
+        if self.__progress_thread:
+            self.__progress_thread.stop()
+        progress_rate = self.__documents.get_setting('progress_rate', Application.PROGRESS_RATE)
+        self.__progress_thread = Ticker(lambda: window.write_event_value('UPDATE_PROGRESS', value=None),
+                                        progress_rate, name='progress')
+        self.__progress_thread.start()
+
+    def __start_page_turner(self):
+        if self.__timeline is None:
+            return
+        timeline, start_page = self.__timeline
+        window = self.__main_window
+        player = self.__player
+        lead_time = self.__documents.get_setting('page_turn_lead', PageTurner.LEAD_TIME)
+        turner = None
+
+        def on_prerender(page):
+            window.write_event_value(Application.EVENT_PAGE_PRERENDER, (turner, page))
+
+        def on_turn(page, target):
+            window.write_event_value(Application.EVENT_PAGE_TURN, (turner, page, target))
+
+        turner = PageTurner(timeline, start_page, player.get_position,
+                            lambda: 0.0 if player.is_paused() else player.get_speed(),
+                            on_prerender, on_turn, lead_time=lead_time)
+        self.__page_turner = turner
+        turner.start()
+
+    def __prerender_pages(self, turner, page):
+        if turner is not self.__page_turner or self.__pdf is None:
+            # outdated event of stopped playback
+            return
+        self.__pdf.prerender(page, self.__pdf_view_size(), step=2)
+
+    def __turn_page(self, turner, page, target):
+        if turner is not self.__page_turner or self.__pdf is None:
+            return
+        self.__pdf.go_to_page(page)
+        is_cache_hit = self.__show_pdf_pages()
+        if target is not None:
+            turner.record_turn(target, is_cache_hit)
+
+    def __stop_page_turner(self):
+        if self.__page_turner is not None:
+            self.__page_turner.stop()
+            self.__page_turner = None
+
+    def __queue_entry(self):
+        window = self.__main_window
+        selected = window.listbox.get()
+        if not selected:
+            sg.popup('Nothing is selected in the list')
+            return
+        self.__setlist.add(selected[0])
+        window.listbox_setlist.update(self.__setlist.entries)
+        if self.__setlist.peek_next() is selected[0]:
+            # added right after the playing entry
+            self.__preload_next()
+
+    def __unqueue_entry(self):
+        window = self.__main_window
+        indexes = window.listbox_setlist.get_indexes()
+        if not indexes:
+            return
+        if indexes[0] == self.__setlist.get_index():
+            sg.popup('The entry is playing, use Skip or Stop')
+            return
+        next_entry = self.__setlist.peek_next()
+        self.__setlist.remove(indexes[0])
+        window.listbox_setlist.update(self.__setlist.entries)
+        if self.__setlist.is_active():
+            window.listbox_setlist.update(set_to_index=[self.__setlist.get_index()])
+            if self.__setlist.peek_next() is not next_entry:
+                self.__preload_next()
+
+    def __play_setlist(self):
+        self.__stop_setlist()
+        entry = self.__setlist.start()
+        if entry is None:
+            sg.popup('Setlist is empty, add entries with Queue')
+            return
+        self.__run_setlist_entry(entry)
+
+    def __next_in_setlist(self):
+        entry = self.__setlist.advance()
+        if entry is None:
+            self.__stop_item()
+            self.__main_window.console.print('Setlist finished')
+            return
+        self.__run_setlist_entry(entry)
+
+    def __run_setlist_entry(self, entry):
+        window = self.__main_window
+        window.listbox_setlist.update(set_to_index=[self.__setlist.get_index()])
+        preloaded = self.__preloaded
+        self.__preloaded = None
+        # report of the previous entry, printed once the console shows the new one
+        stats = self.__entry_stats()
+        try:
+            if preloaded is not None and preloaded.code == entry.code and preloaded.is_ready():
+                self.__switch_to_preloaded(entry, preloaded, stats)
+            else:
+                if preloaded is not None:
+                    preloaded.cancel()
+                # progress of the previous entry would see its finished track
+                if self.__progress_thread:
+                    self.__progress_thread.stop()
+                    self.__progress_thread = None
+                window.console.Update(f'Running {entry.name}...\n')
+                for line in stats:
+                    window.console.print(line)
+                window.refresh()
+                self.__run_process(entry.code)
+            self.__update_ui_states()
+        except Exception as ex:
+            self.__stop_item()
+            sg.popup(f'Error {ex}')
+
+    def __switch_to_preloaded(self, entry, preloaded, stats=()):
+        """Starts the entry opened in the background, without the preparation wait"""
+        start = monotonic()
+        window = self.__main_window
+        document = preloaded.document
+        pdf, track = preloaded.take()
+        self.__cancel_prepare()
+        self.__stop_page_turner()
+        self.__loop_start = None
+        count_in_bars = self.__apply_entry_settings(document)
+        if track is not None:
+            self.__player.start_preloaded(track, count_in_bars)
+            # practice speed may have been changed since the preload
+            self.__player.set_speed(int(window.spin_speed.get()) / 100)
+        else:
             self.__player.stop()
-            self.__player.play(audio_path)
-            self.__is_playing = True
+            if window.chk_click.get():
+                self.__player.start()
+        self.__is_playing = True
+        self.__is_pause = False
+        self.__close_pdf()
+        self.__clear_waveform()
+        if pdf is not None:
+            self.__pdf = pdf
+            self.__show_pdf_pages()
+        else:
+            window.img_pdf1.update(data=None)
+            window.img_pdf2.update(data=None)
+        if track is not None:
+            self.__waveform_path = preloaded.audio_path
+            self.__waveform_worker.submit([lambda: self.__load_waveform(preloaded.audio_path)])
+        self.__timeline = None
+        if pdf is not None and track is not None and document.get('timeline'):
+            self.__timeline = (document['timeline'], document.get('page_num', 0))
+            self.__start_page_turner()
+        if self.__progress_thread is None:
+            self.__start_progress()
+        elif self.__progress_thread.is_paused():
+            self.__progress_thread.resume()
+        window.console.Update(f'Running {entry.name}...\n')
+        for line in stats:
+            window.console.print(line)
+        window.console.print(f'Switched in {(monotonic() - start) * 1000:.0f} ms')
+        self.__preload_next()
+
+    def __preload_next(self):
+        """Opens the next entry of the setlist in the background, while the current one is playing"""
+        self.__drop_preloaded()
+        entry = self.__setlist.peek_next()
+        if entry is None:
+            return
+        document = self.__documents.get_item(entry.code)
+        if document is None:
+            return
+        preloaded = PreloadedEntry(entry.code, document)
+        self.__preloaded = preloaded
+        view_size = self.__pdf_view_size()
+        render_mode = document.get('render_mode') or \
+            self.__documents.get_setting('render_mode', PdfDocument.RENDER_AUTO)
+        speed = int(self.__main_window.spin_speed.get()) / 100
+        self.__preload_worker.submit([lambda: self.__preload(preloaded, view_size, render_mode, speed)])
+
+    def __preload(self, preloaded, view_size, render_mode, speed):
+        start = monotonic()
+        document = preloaded.document
+        try:
+            if document.get('pdf'):
+                pdf = PdfDocument(self.__documents.expand_path(document['pdf']), self.__render_cache, render_mode,
+                                  disk_cache=self.__disk_cache)
+                pdf.go_to_page(document.get('page_num', 0))
+                preloaded.set_pdf(pdf)
+                if not preloaded.is_cancelled():
+                    self.__render_spread(pdf, view_size)
+            if document.get('audio') and not preloaded.is_cancelled():
+                preloaded.audio_path = self.__documents.expand_path(document['audio'])
+                preloaded.set_track(self.__player.preload(preloaded.audio_path, document.get('transpose', 0), speed))
+            preloaded.set_ready()
+        except Exception as ex:
+            preloaded.set_ready(error=ex)
+        self.__main_window.write_event_value(Application.EVENT_PRELOADED, (preloaded, monotonic() - start))
+
+    def __on_preloaded(self, preloaded, duration):
+        if preloaded is not self.__preloaded:
+            return
+        name = preloaded.document['name']
+        if preloaded.error is not None:
+            self.__main_window.console.print(f'Cannot prepare {name}: {preloaded.error}')
+        else:
+            self.__main_window.console.print(f'Next: {name} (prepared in {int(duration * 1000)} ms)')
+
+    def __drop_preloaded(self):
+        if self.__preloaded is not None:
+            self.__preloaded.cancel()
+            self.__preloaded = None
+
+    def __stop_setlist(self):
+        self.__setlist.stop()
+        self.__drop_preloaded()
+
+    def __start_control(self):
+        """Remote control over TCP on localhost and MIDI, enabled with control_port and midi_input settings"""
+        port = self.__documents.get_setting('control_port')
+        midi_input = self.__documents.get_setting('midi_input')
+        if port is None and midi_input is None:
+            return
+        control = ControlServer(self.__main_window, self.__player.get_position, port=port, midi_input=midi_input,
+                                midi_map=self.__documents.get_setting('midi_map'))
+        try:
+            control.start()
+        except Exception as ex:
+            control.stop()
+            self.__main_window.console.print(f'Remote control is off: {ex}')
+            return
+        self.__control = control
+        if port is not None:
+            self.__main_window.console.print(f'Remote control on port {port}')
+
+    def __on_control_command(self, command, argument, received, client):
+        error = None
+        try:
+            if command == 'next':
+                self.__next_page()
+            elif command == 'prev':
+                self.__prev_page()
+            elif command == 'zoom_in':
+                self.__zoom_in()
+            elif command == 'zoom_out':
+                self.__zoom_out()
+            elif command == 'pause' and self.__is_playing:
+                self.__pause_item()
+            elif command == 'stop' and self.__is_playing:
+                self.__stop_item()
+            elif command == 'skip' and self.__setlist.is_active():
+                self.__next_in_setlist()
+            elif command == 'seek':
+                self.__seek(float(argument) * 1000)
+            elif command == 'page' and self.__pdf is not None:
+                self.__pdf.go_to_page(int(argument))
+                self.__show_pdf_pages()
+            elif command == 'state':
+                self.__publish_state()
+            self.__main_window.refresh()
+        except (TypeError, ValueError):
+            error = f'Invalid argument of {command}: {argument}'
+        except Exception as ex:
+            error = ex
+        self.__control.acknowledge(client, command, monotonic() - received, error=error)
+
+    def __publish_state(self):
+        if self.__control is None:
+            return
+        pdf = self.__pdf
+        self.__control.publish({
+            'playing': self.__is_playing,
+            'paused': self.__player.is_paused(),
+            'length': self.__player.get_len_ms() / 1000,
+            'page': pdf.current_page_num() if pdf is not None else None,
+            'pages': len(pdf) if pdf is not None else None,
+        })
 
     def __stop_player(self):
+        self.__stop_page_turner()
         self.__player.stop()
+        self.__loop_start = None
         self.__is_playing = False
 
+    def __mark_loop_start(self):
+        self.__loop_start = self.__player.get_pos_ms() / 1000
+        self.__main_window.console.print(f'Loop start at {self.__loop_start:.1f} s')
+        self.__update_ui_states()
+
+    def __mark_loop_end(self):
+        if self.__loop_start is None:
+            return
+        loop_end = self.__player.get_pos_ms() / 1000
+        if loop_end <= self.__loop_start:
+            sg.popup('Loop end must be after its start')
+            return
+        self.__player.set_loop(self.__loop_start, loop_end)
+        self.__player.seek(self.__loop_start)
+        self.__main_window.console.print(f'Looping {self.__loop_start:.1f} - {loop_end:.1f} s')
+        self.__update_ui_states()
+
+    def __clear_loop(self):
+        self.__player.clear_loop()
+        self.__loop_start = None
+        self.__main_window.console.print('Loop off')
+        self.__update_ui_states()
+
     def __ui_loop(self):
         window = self.__main_window
         while True:
@@ -225,6 +816,18 @@ class Application:
                     self.__stop_item()
                 elif event == 'Pause':
                     self.__pause_item()
+                elif event == 'LoopA':
+                    self.__mark_loop_start()
+                elif event == 'LoopB':
+                    self.__mark_loop_end()
+                elif event == 'LoopOff':
+                    self.__clear_loop()
+                elif event == 'Transpose':
+                    self.__player.set_transpose(int(values[event]))
+                elif event in ('Click', 'Bpm', 'TimeSignature'):
+                    self.__player.set_click(*self.__click_settings())
+                elif event == 'Speed':
+                    self.__player.set_speed(int(values[event]) / 100)
                 elif event == 'Up' or event == 'Prior:112':
                     self.__prev_page()
                 elif event == 'Down' or event == 'Next:117':
@@ -239,6 +842,28 @@ class Application:
                     self.__zoom_out()
                 elif event == 'UPDATE_PROGRESS':
                     self.__update_progress()
+                    if self.__setlist.is_active() and self.__player.is_finished():
+                        self.__next_in_setlist()
+                elif event == 'Waveform':
+                    self.__seek(values[event][0])
+                elif event == Application.EVENT_WAVEFORM:
+                    self.__show_waveform(*values[event])
+                elif event == Application.EVENT_PAGE_PRERENDER:
+                    self.__prerender_pages(*values[event])
+                elif event == Application.EVENT_PAGE_TURN:
+                    self.__turn_page(*values[event])
+                elif event == Application.EVENT_CONFIGURE:
+                    self.__on_configure()
+                elif event == Application.EVENT_RESIZE_SETTLED:
+                    if self.__pdf_view_size() != self.__shown_view_size:
+                        self.__show_pdf_pages(keep_preview=True)
+                elif event == Application.EVENT_PDF_REFINED:
+                    # ignore renders superseded by later page turns or zoom changes
+                    if values[event] == self.__pdf_generation:
+                        self.__show_pdf_pages()
+                elif event in (PreparePipeline.EVENT_PDF_READY, PreparePipeline.EVENT_COUNTDOWN,
+                               PreparePipeline.EVENT_DONE, PreparePipeline.EVENT_ERROR):
+                    self.__on_prepare_event(event, values[event])
                 elif event == Application.LIST_FILTER_ALL:
                     self.__filter_documents()
                 elif event == Application.LIST_FILTER_AUDIO_ONLY:
@@ -253,6 +878,28 @@ class Application:
                     self.__filter_documents()
                 elif event == Application.LIST_TENOR:
                     self.__filter_documents()
+                elif event == 'Find':
+                    self.__find_in_pdfs(values['SearchText'])
+                elif event == 'SearchHits':
+                    if values[event]:
+                        self.__run_hit(values[event][0])
+                elif event == 'Queue':
+                    self.__queue_entry()
+                elif event == 'Unqueue':
+                    self.__unqueue_entry()
+                elif event == 'PlayList':
+                    self.__play_setlist()
+                elif event == 'SkipEntry':
+                    self.__next_in_setlist()
+                elif event == ControlServer.EVENT_COMMAND:
+                    self.__on_control_command(*values[event])
+                elif event == Application.EVENT_RUN_ENTRY:
+                    document = self.__documents.get_item(values[event])
+                    self.__run_entry(values[event], document['name'] if document else values[event])
+                elif event == Application.EVENT_PRELOADED:
+                    self.__on_preloaded(*values[event])
+                elif event == Application.EVENT_HEALTH_CHECKED:
+                    self.__on_health_checked(values[event])
                 elif event == 'Edit':
                     self.__edit_entry()
                 elif event == 'Add':
@@ -263,21 +910,43 @@ class Application:
                 sg.popup(f'Error: {ex}')
 
     def __update_progress(self):
-        position = self.__player.get_pos()
-        max_position = self.__player.get_len()
-        if position is not None:
-            self.__main_window.progress_bar.update(position, max=max_position)
+        if self.__player.get_len_ms() == 0:
+            return
+        graph = self.__main_window.waveform
+        if self.__waveform_cursor is None:
+            graph.change_coordinates((0, -1), (self.__player.get_len_ms(), 1))
+            self.__waveform_cursor = graph.draw_line((0, -1), (0, 1), color='red', width=2)
+        graph.relocate_figure(self.__waveform_cursor, self.__player.get_pos_ms(), -1)
+
+    def __clear_waveform(self):
+        self.__waveform_path = None
+        self.__waveform_cursor = None
+        self.__main_window.waveform.erase()
+
+    def __click_settings(self):
+        window = self.__main_window
+        beats_per_bar = int(window.combo_signature.get().split('/')[0])
+        return window.chk_click.get(), int(window.spin_bpm.get()), beats_per_bar
 
     def __stop_item(self):
+        self.__stop_setlist()
+        self.__cancel_prepare()
         if self.__progress_thread:
             self.__progress_thread.stop()
         self.__progress_thread = None
         window = self.__main_window
         console = window.console
+        for line in self.__entry_stats():
+            console.print(line)
+        control_stats = self.__control.get_latency_stats() if self.__control is not None else None
+        if control_stats is not None:
+            commands, mean_latency, max_latency = control_stats
+            console.print(f'Remote commands: {commands}, latency mean {mean_latency * 1000:.1f} ms, '
+                          f'max {max_latency * 1000:.1f} ms')
         self.__stop_player()
         self.__is_playing = False
         console.print('Finished\n')
-        window.progress_bar.update(0)
+        self.__clear_waveform()
 
         # win_size = sg.Window.get_screen_size()
         # win_size = (win_size[0] - 10, win_size[1] - 70)
@@ -287,40 +956,53 @@ class Application:
         # empty_image.save(empty_image_bytes, format='PNG')
         # empty_image_data = empty_image_bytes.getvalue()
 
+        self.__close_pdf()
         self.__main_window.img_pdf1.update(data=None)
         self.__main_window.img_pdf2.update(data=None)
         self.__update_ui_states()
         window.refresh()
 
+    def __entry_stats(self):
+        """Returns report lines of the playing entry (click jitter, page turns), read before the entry is stopped"""
+        lines = []
+        jitter = self.__player.get_click_jitter()
+        if jitter is not None:
+            lines.append(f'Click scheduling jitter: {jitter * 1000:.3f} ms')
+        turn_stats = self.__page_turner.get_stats() if self.__page_turner is not None else None
+        if turn_stats is not None:
+            turns, hits, mean_latency, max_latency = turn_stats
+            lines.append(f'Page turns: {turns} ({hits} prerendered), latency mean {mean_latency * 1000:.1f} ms, '
+                         f'max {max_latency * 1000:.1f} ms')
+        return lines
+
     def __pause_item(self):
         window = self.__main_window
         console = window.console
         self.__player.pause()  # or unpause (if it's paused already)
         self.__is_pause = self.__player.is_paused()
+        if self.__progress_thread:
+            if self.__is_pause:
+                self.__progress_thread.pause()
+            else:
+                self.__progress_thread.resume()
         console.Update('Paused..\n' if self.__player.is_paused() else 'Playing..\n')
         self.__update_ui_states()
 
     def __run_item(self):
         window = self.__main_window
-        console = window.console
         selected = window.listbox.get()
         if selected is None or len(selected) == 0:
             sg.popup('Nothing is selected in the list')
             return
+        self.__run_entry(selected[0].code, selected[0].name)
+
+    def __run_entry(self, code, name, page_num=None):
+        window = self.__main_window
+        self.__stop_setlist()
         try:
-            code = selected[0].code
-            name = selected[0].name
-            console.Update(f'Running {name}...\n')
+            window.console.Update(f'Running {name}...\n')
             window.refresh()
-            self.__run_process(code)
-            console.print('In progress...')
-            audio_len = self.__player.get_len()
-            window.progress_bar.update(max=audio_len)
-            window.btn_stop.update(disabled=False)
-            window.btn_pause.update(disabled=False)
-            self.__progress_thread = ThreadUpdater(window)
-            window.start_thread(lambda: self.__progress_thread.run(), end_key='UPDATE_PROGRESS_END')
-            self.__is_playing = True
+            self.__run_process(code, page_num=page_num)
             self.__update_ui_states()
         except Exception as ex:
             window.btn_stop.update(disabled=True)
@@ -328,12 +1010,27 @@ class Application:
             window.refresh()
             sg.popup(f'Error {ex}')
 
+    def __find_in_pdfs(self, query):
+        window = self.__main_window
+        hits = self.__search_index.search_entries(self.__documents, query)
+        window.listbox_hits.update(hits)
+        if not hits and query.strip():
+            window.console.print(f'Nothing found for: {query}')
+
+    def __run_hit(self, hit):
+        """Runs the entry with its PDF opened at the found page"""
+        self.__run_entry(hit.code, str(hit), page_num=hit.page_num)
+
     def __update_ui_states(self):
         selected = self.__main_window.listbox.get()
         is_selected = (selected and len(selected) > 0)
         window = self.__main_window
         window.btn_stop.update(disabled=not self.__is_playing)
         window.btn_pause.update(disabled=not self.__is_playing)
+        window.btn_loop_a.update(disabled=not self.__is_playing)
+        window.btn_loop_b.update(disabled=self.__loop_start is None)
+        window.btn_loop_off.update(disabled=self.__player.get_loop() is None)
+        window.spin_transpose.update(disabled=not self.__is_playing)
         window.rd_all.update(disabled=self.__is_playing)
         window.rd_audio_only.update(disabled=self.__is_playing)
         window.rd_pdf_only.update(disabled=self.__is_playing)
@@ -344,7 +1041,9 @@ class Application:
         window.btn_zoom_out.update(disabled=not self.__is_playing)
         window.btn_edit.update(disabled=not is_selected or self.__is_playing)
         window.btn_add_new.update(disabled=self.__is_playing)
+        window.btn_skip.update(disabled=not self.__setlist.is_active())
         window.refresh()
+        self.__publish_state()
 
     def __filter_documents(self):
         window = self.__main_window
@@ -367,22 +1066,23 @@ class Application:
             pdf=True
 
         listbox = window.listbox
-        items = self.__documents.get_entries()
-        result_items = []
-        for item in items:
-            if tags is not None and len(tags) > 0:
-                if not any(tag.lower() in item.tags for tag in tags):
-                    continue
-            if audio is not None:
-                if audio != item.is_audio:
-                    continue
-            if pdf is not None:
-                if pdf != item.is_pdf:
-                    continue
-            result_items.append(item)
+        result_items = self.__documents.filter_entries(tags=tags, audio=audio, pdf=pdf)
         listbox.update(result_items)
         self.__main_window.refresh()
 
+    def __on_health_checked(self, missing):
+        self.__documents.set_missing(missing)
+        if not missing:
+            return
+        # list items show the flag in their text, the list is updated keeping the selection
+        listbox = self.__main_window.listbox
+        selected = listbox.get()
+        items = listbox.get_list_values()
+        listbox.update(items)
+        if selected and selected[0] in items:
+            listbox.update(set_to_index=[items.index(selected[0])])
+        self.__main_window.console.print(f'{len(missing)} entries with missing files')
+
     def __next_page(self):
         pdf = self.__pdf
         if not pdf:
@@ -428,10 +1128,10 @@ class Application:
             sg.popup('Nothing is selected in the list')
             return
         code = selected[0].code
-        if code not in self.__documents.get_items().keys():
+        entry = self.__documents.get_item(code)
+        if entry is None:
             print('Cannot find document')
             return
-        entry = self.__documents.get_items()[code]
         edit_window = EntryEditor()
         result = edit_window.edit_entry(code, entry)
         if result is not None:
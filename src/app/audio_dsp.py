@@ -0,0 +1,176 @@
+from collections import deque
+
+import numpy as np
+
+
+class PhaseVocoder:
+    """
+    Streaming phase vocoder time-stretch. Input is consumed in chunks of any size, all analysis frames
+    available in a chunk are processed at once (batched FFT along the frame axis).
+    Synthesis hop is fixed, analysis hop is synthesis hop / stretch, so stretched sample s
+    corresponds exactly to the input sample s / stretch.
+    """
+    FRAME = 2048
+    HOP = FRAME // 4
+    # sum of squared periodic Hann windows overlapping with 1/4 frame hop
+    WINDOW_GAIN = 1.5
+
+    def __init__(self, channels, stretch=1.0):
+        self.__channels = channels
+        self.__window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(PhaseVocoder.FRAME) / PhaseVocoder.FRAME)) \
+            .astype(np.float32)[None, :, None]
+        self.__omega = (2 * np.pi * np.arange(PhaseVocoder.FRAME // 2 + 1) / PhaseVocoder.FRAME)[None, :, None]
+        self.set_stretch(stretch)
+        self.reset()
+
+    def reset(self):
+        self.__input = np.zeros((0, self.__channels), dtype=np.float32)
+        self.__input_offset = 0
+        self.__analysis_pos = 0.0
+        self.__prev_frame_pos = None
+        self.__prev_phase = None
+        self.__synth_phase = None
+        self.__tail = np.zeros((PhaseVocoder.FRAME - PhaseVocoder.HOP, self.__channels), dtype=np.float32)
+
+    def set_stretch(self, stretch):
+        self.__analysis_hop = PhaseVocoder.HOP / stretch
+
+    def process(self, samples):
+        """Returns stretched samples available after adding the input chunk"""
+        frame, hop = PhaseVocoder.FRAME, PhaseVocoder.HOP
+        buffer = np.concatenate((self.__input, samples)) if len(self.__input) else samples
+        count = int((len(buffer) - frame - self.__analysis_pos) // self.__analysis_hop) + 1 \
+            if len(buffer) - frame >= self.__analysis_pos else 0
+        if count <= 0:
+            self.__input = buffer
+            return np.zeros((0, self.__channels), dtype=np.float32)
+
+        positions = self.__analysis_pos + self.__analysis_hop * np.arange(count)
+        starts = np.minimum(np.round(positions).astype(np.int64), len(buffer) - frame)
+        frames = buffer[starts[:, None] + np.arange(frame)[None, :]] * self.__window
+        spectrum = np.fft.rfft(frames, axis=1)
+        magnitude = np.abs(spectrum)
+        phase = np.angle(spectrum)
+
+        # phase advance of each bin between consecutive analysis frames, scaled to the synthesis hop
+        absolute_starts = starts + self.__input_offset
+        if self.__prev_frame_pos is None:
+            hops = np.diff(absolute_starts, prepend=absolute_starts[0])
+            prev_phase = np.concatenate((phase[:1], phase[:-1]))
+        else:
+            hops = np.diff(absolute_starts, prepend=self.__prev_frame_pos)
+            prev_phase = np.concatenate((self.__prev_phase, phase[:-1]))
+        hops = np.maximum(hops, 1)[:, None, None]
+        deviation = phase - prev_phase - self.__omega * hops
+        deviation = (deviation + np.pi) % (2 * np.pi) - np.pi
+        advance = (self.__omega * hops + deviation) * (hop / hops)
+        if self.__synth_phase is None:
+            advance[0] = phase[0]
+            synth_phase = np.cumsum(advance, axis=0)
+        else:
+            synth_phase = self.__synth_phase + np.cumsum(advance, axis=0)
+
+        output_frames = np.fft.irfft(magnitude * np.exp(1j * synth_phase), n=frame, axis=1) * self.__window
+        output_frames = output_frames.astype(np.float32) / PhaseVocoder.WINDOW_GAIN
+
+        # overlap-add: frame is 4 hops long, each quarter lands on consecutive output blocks
+        accumulator = np.zeros(((count - 1) * hop + frame, self.__channels), dtype=np.float32)
+        accumulator[:frame - hop] += self.__tail
+        for quarter in range(frame // hop):
+            accumulator[quarter * hop:quarter * hop + count * hop] += \
+                output_frames[:, quarter * hop:(quarter + 1) * hop].reshape(count * hop, self.__channels)
+        self.__tail = accumulator[count * hop:]
+
+        self.__prev_frame_pos = absolute_starts[-1]
+        self.__prev_phase = phase[-1:]
+        self.__synth_phase = synth_phase[-1:] % (2 * np.pi)
+        next_pos = positions[-1] + self.__analysis_hop
+        consumed = min(int(next_pos), len(buffer))
+        self.__input = buffer[consumed:]
+        self.__input_offset += consumed
+        self.__analysis_pos = next_pos - consumed
+        return accumulator[:count * hop]
+
+
+class Resampler:
+    """Streaming linear interpolation resampler, reads the input with the given step per output sample"""
+
+    def __init__(self, channels, step=1.0):
+        self.__channels = channels
+        self.step = step
+        self.reset()
+
+    def reset(self):
+        self.__input = np.zeros((0, self.__channels), dtype=np.float32)
+        self.__pos = 0.0
+
+    def process(self, samples):
+        buffer = np.concatenate((self.__input, samples)) if len(self.__input) else samples
+        # interpolation needs the next sample, so the last one is kept for the following chunk
+        last = len(buffer) - 1
+        if last <= self.__pos:
+            self.__input = buffer
+            return np.zeros((0, self.__channels), dtype=np.float32)
+        count = int(np.ceil((last - self.__pos) / self.step))
+        positions = self.__pos + self.step * np.arange(count)
+        index = positions.astype(np.int64)
+        fraction = (positions - index).astype(np.float32)[:, None]
+        output = buffer[index] * (1 - fraction) + buffer[index + 1] * fraction
+        next_pos = self.__pos + self.step * count
+        consumed = int(next_pos)
+        self.__input = buffer[consumed:]
+        self.__pos = next_pos - consumed
+        return output
+
+
+class PitchTempoShifter:
+    """
+    Streaming pitch transposition (by semitones) and tempo change (speed factor) applied independently:
+    audio is time-stretched by pitch ratio / speed and then resampled by the pitch ratio.
+    Output sample n corresponds to input sample n * speed, processing only adds a latency
+    of one analysis frame. Output chunks are mapped back to source track positions, also across loop jumps.
+    """
+    MIN_SPEED = 0.5
+    MAX_SPEED = 1.5
+
+    def __init__(self, channels, semitones=0.0, speed=1.0):
+        if not PitchTempoShifter.MIN_SPEED <= speed <= PitchTempoShifter.MAX_SPEED:
+            raise Exception(f'Speed must be between {PitchTempoShifter.MIN_SPEED} and {PitchTempoShifter.MAX_SPEED}')
+        self.__channels = channels
+        ratio = 2.0 ** (semitones / 12.0)
+        self.__speed = speed
+        self.__vocoder = PhaseVocoder(channels, ratio / speed)
+        self.__resampler = Resampler(channels, ratio)
+        self.__segments = deque()
+        self.__stream_in = 0
+        self.__stream_out = 0
+        self.__flushed = False
+
+    def get_speed(self):
+        return self.__speed
+
+    def process(self, samples, src_start):
+        """Returns processed samples and the source position of the first one"""
+        if not self.__segments or self.__segments[-1][1] + (self.__stream_in - self.__segments[-1][0]) != src_start:
+            self.__segments.append((self.__stream_in, src_start))
+        self.__stream_in += len(samples)
+        return self.__output(self.__resampler.process(self.__vocoder.process(samples)))
+
+    def flush(self):
+        """Pushes out samples held by the processing latency (at the end of the track)"""
+        if self.__flushed:
+            return np.zeros((0, self.__channels), dtype=np.float32), 0
+        self.__flushed = True
+        expected = int(self.__stream_in / self.__speed) - self.__stream_out
+        padding = np.zeros((PhaseVocoder.FRAME * 2, self.__channels), dtype=np.float32)
+        last_stream, last_src = self.__segments[-1] if self.__segments else (0, 0)
+        samples, src_start = self.process(padding, last_src + self.__stream_in - last_stream)
+        return samples[:max(0, expected)], src_start
+
+    def __output(self, samples):
+        stream_pos = self.__stream_out * self.__speed
+        self.__stream_out += len(samples)
+        while len(self.__segments) > 1 and self.__segments[1][0] <= stream_pos:
+            self.__segments.popleft()
+        segment_stream, segment_src = self.__segments[0]
+        return samples, segment_src + stream_pos - segment_stream
@@ -0,0 +1,384 @@
+import threading
+from collections import deque
+
+import numpy as np
+import sounddevice as sd
+import soundfile as sf
+
+from .audio_dsp import PitchTempoShifter
+from .metronome import Metronome
+
+
+class AudioChunk:
+    """
+    Block of decoded samples with the position in the source track of its first frame.
+    Source step is the number of source frames per output frame (differs from 1 only when audio is time-stretched).
+    """
+    __slots__ = ('samples', 'src_start', 'src_step', 'generation')
+
+    def __init__(self, samples, src_start, src_step=1.0, generation=0):
+        self.samples = samples
+        self.src_start = src_start
+        self.src_step = src_step
+        self.generation = generation
+
+
+class ChunkRing:
+    """
+    Bounded FIFO of audio chunks between the decoder thread and the audio callback.
+    The callback side never blocks, the decoder waits while the ring is full.
+    """
+
+    def __init__(self, max_chunks):
+        self.__chunks = deque()
+        self.__max_chunks = max_chunks
+        self.condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.__chunks)
+
+    def is_full(self):
+        return len(self.__chunks) >= self.__max_chunks
+
+    def put(self, chunk):
+        with self.condition:
+            self.__chunks.append(chunk)
+
+    def pop(self):
+        with self.condition:
+            chunk = self.__chunks.popleft() if self.__chunks else None
+            self.condition.notify_all()
+            return chunk
+
+    def clear(self):
+        with self.condition:
+            self.__chunks.clear()
+            self.condition.notify_all()
+
+
+class StreamEngine:
+    """
+    Streaming playback engine. A decoder thread reads the file in chunks into a bounded ring,
+    which is drained by the audio output callback, so memory use doesn't depend on the track length.
+    Position is counted in frames played by the callback (sample accurate).
+    Seeking jumps directly to the frame (decoders keep their own frame index, e.g. mpg123 for MP3).
+    A-B loops up to LOOP_CACHE_SECONDS are decoded once and replayed from memory, so looping is gapless.
+    Transposition and tempo change are applied by the decoder thread, so the audio callback only copies samples.
+    Position is always reported in source track time, also when the tempo is changed.
+    Metronome clicks and count-in are mixed by the callback, so they are sample accurate.
+    Without a loaded file the engine plays the metronome only.
+    """
+    CHUNK_FRAMES = 4096
+    RING_CHUNKS = 16
+    BLOCK_FRAMES = 1024
+    LOOP_CACHE_SECONDS = 60
+    # used for the metronome when no audio file is loaded
+    DEFAULT_SAMPLE_RATE = 44100
+    DEFAULT_CHANNELS = 2
+
+    def __init__(self):
+        self.__file = None
+        self.__stream = None
+        self.__decoder = None
+        self.__ring = ChunkRing(StreamEngine.RING_CHUNKS)
+        self.__sample_rate = 0
+        self.__channels = 0
+        self.__frames = 0
+        self.__paused = False
+        self.__semitones = 0
+        self.__speed = 1.0
+        self.__gain = 1.0
+        self.__metronome = None
+        self.__click = (False, 120, 4)
+        self.__count_in = 0
+        self.__reset()
+
+    def __reset(self):
+        self.__terminated = False
+        self.__eof = False
+        # decoder state, guarded by the ring condition
+        self.__generation = 0
+        self.__read_pos = 0
+        self.__file_pos = 0
+        self.__loop = None
+        self.__loop_cache = None
+        self.__processor = None
+        self.__processor_generation = None
+        # callback state
+        self.__chunk = None
+        self.__chunk_offset = 0
+        self.__position = 0.0
+
+    def load(self, path, semitones=0, speed=1.0):
+        """Opens the file and fills the ring, so playback starts from buffered data"""
+        self.close()
+        self.__semitones = semitones
+        self.__speed = speed
+        self.__file = sf.SoundFile(path)
+        self.__sample_rate = self.__file.samplerate
+        self.__channels = self.__file.channels
+        self.__frames = self.__file.frames
+        self.__paused = False
+        self.__reset()
+        self.__ring.clear()
+        while not self.__ring.is_full() and self.__decode_next():
+            pass
+        self.__decoder = threading.Thread(target=self.__run_decoder, name='audio-decoder', daemon=True)
+        self.__decoder.start()
+
+    def start(self, count_in_bars=0):
+        """Starts the output, the track is preceded by count-in bars of metronome clicks"""
+        enabled, bpm, beats_per_bar = self.__click
+        if self.__file is None and not enabled:
+            return
+        if self.__stream is not None:
+            # started again (e.g. metronome only entry run twice), the old stream would keep mixing clicks
+            self.__stream.close()
+            self.__stream = None
+        sample_rate = self.__sample_rate or StreamEngine.DEFAULT_SAMPLE_RATE
+        channels = self.__channels or StreamEngine.DEFAULT_CHANNELS
+        metronome = Metronome(sample_rate, bpm, beats_per_bar)
+        metronome.enabled = enabled
+        metronome.set_speed(self.__speed)
+        self.__count_in = count_in_bars * metronome.bar_frames()
+        self.__metronome = metronome
+        self.__stream = sd.OutputStream(samplerate=sample_rate, channels=channels, dtype='float32',
+                                        blocksize=StreamEngine.BLOCK_FRAMES, callback=self.__callback)
+        self.__stream.start()
+
+    def is_streaming(self):
+        return self.__stream is not None
+
+    def set_click(self, enabled, bpm, beats_per_bar):
+        self.__click = (enabled, bpm, beats_per_bar)
+        metronome = self.__metronome
+        if metronome is not None:
+            metronome.set_tempo(bpm, beats_per_bar)
+            metronome.enabled = enabled
+
+    def get_click_jitter(self):
+        metronome = self.__metronome
+        return metronome.get_jitter() if metronome is not None else None
+
+    def close(self):
+        if self.__stream is not None:
+            self.__stream.close()
+            self.__stream = None
+        self.__metronome = None
+        self.__count_in = 0
+        with self.__ring.condition:
+            self.__terminated = True
+            self.__ring.condition.notify_all()
+        if self.__decoder is not None:
+            self.__decoder.join()
+            self.__decoder = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+        self.__ring.clear()
+
+    def set_paused(self, paused):
+        # callback keeps running and plays silence, so resuming is instant
+        self.__paused = paused
+        metronome = self.__metronome
+        if metronome is not None:
+            # block times keep going while no clicks are mixed
+            metronome.clear_onsets()
+
+    def is_finished(self):
+        return self.__file is not None and self.__eof and self.__chunk is None and len(self.__ring) == 0
+
+    def get_position(self):
+        """Position (in seconds) of the sample being heard now"""
+        if not self.__sample_rate:
+            return 0.0
+        latency = self.__stream.latency if self.__stream is not None and not self.__paused else 0.0
+        # output latency is in played time, which runs faster or slower than the source when tempo is changed
+        return max(0.0, self.__position / self.__sample_rate - latency * self.__speed)
+
+    def get_duration(self):
+        """Duration from the decoder, used when the file headers don't tell it"""
+        return self.__frames / self.__sample_rate if self.__sample_rate else 0.0
+
+    def seek(self, seconds):
+        frame = min(max(0, int(round(seconds * self.__sample_rate))), self.__frames)
+        with self.__ring.condition:
+            self.__restart_at(frame)
+        self.__position = float(frame)
+
+    def set_loop(self, start, end):
+        """Loops playback between start and end (in seconds)"""
+        start_frame = max(0, int(round(start * self.__sample_rate)))
+        end_frame = min(self.__frames, int(round(end * self.__sample_rate)))
+        if end_frame <= start_frame:
+            raise Exception('Loop end must be after its start')
+        with self.__ring.condition:
+            self.__loop = (start_frame, end_frame)
+            self.__loop_cache = None
+            position = int(self.__position)
+            # chunks already in the ring may cross the new loop end
+            self.__restart_at(position if start_frame <= position < end_frame else start_frame)
+
+    def clear_loop(self):
+        with self.__ring.condition:
+            if self.__loop is None:
+                return
+            self.__loop = None
+            self.__loop_cache = None
+            self.__restart_at(int(self.__position))
+
+    def set_transpose(self, semitones):
+        """Changes the pitch by semitones, buffered audio is dropped so the change is heard at once"""
+        with self.__ring.condition:
+            if semitones == self.__semitones:
+                return
+            self.__semitones = semitones
+            if self.__file is not None:
+                self.__restart_at(int(self.__position))
+
+    def get_transpose(self):
+        return self.__semitones
+
+    def set_speed(self, speed):
+        """Changes the tempo (1.0 is the original one) keeping the pitch"""
+        if not PitchTempoShifter.MIN_SPEED <= speed <= PitchTempoShifter.MAX_SPEED:
+            raise Exception(f'Speed must be between {PitchTempoShifter.MIN_SPEED} and {PitchTempoShifter.MAX_SPEED}')
+        with self.__ring.condition:
+            if speed == self.__speed:
+                return
+            self.__speed = speed
+            if self.__file is not None:
+                self.__restart_at(int(self.__position))
+        if self.__metronome is not None:
+            self.__metronome.set_speed(speed)
+
+    def get_speed(self):
+        return self.__speed
+
+    def set_gain(self, gain):
+        """Linear gain of the track (not the metronome), applied to newly decoded chunks"""
+        self.__gain = gain
+
+    def get_loop(self):
+        loop = self.__loop
+        if loop is None:
+            return None
+        return loop[0] / self.__sample_rate, loop[1] / self.__sample_rate
+
+    def __restart_at(self, frame):
+        """Drops buffered audio and continues decoding from the frame (called with the ring condition held)"""
+        self.__generation += 1
+        self.__read_pos = frame
+        self.__eof = False
+        self.__ring.clear()
+
+    def __run_decoder(self):
+        while True:
+            with self.__ring.condition:
+                self.__ring.condition.wait_for(lambda: self.__terminated or
+                                               (not self.__ring.is_full() and not self.__eof))
+                if self.__terminated:
+                    return
+            self.__decode_next()
+
+    def __decode_next(self):
+        """Decodes next chunk into the ring, returns False at the end of the track"""
+        with self.__ring.condition:
+            generation = self.__generation
+            loop = self.__loop
+            read_pos = self.__read_pos
+            semitones = self.__semitones
+            speed = self.__speed
+
+        if loop is not None and read_pos >= loop[1]:
+            read_pos = loop[0]
+        frames = StreamEngine.CHUNK_FRAMES
+        if loop is not None and read_pos < loop[1]:
+            frames = min(frames, loop[1] - read_pos)
+
+        loop_cache = self.__get_loop_cache(loop)
+        if loop_cache is not None and loop[0] <= read_pos < loop[1]:
+            samples = loop_cache[read_pos - loop[0]:read_pos - loop[0] + frames]
+        else:
+            if self.__file_pos != read_pos:
+                self.__file.seek(read_pos)
+            samples = self.__file.read(frames, dtype='float32', always_2d=True)
+            self.__file_pos = read_pos + len(samples)
+
+        output, src_start = self.__process(samples, read_pos, semitones, speed, generation)
+        gain = self.__gain
+        if gain != 1.0 and len(output):
+            # new array, decoded samples may be kept by the loop cache
+            output = output * np.float32(gain)
+
+        with self.__ring.condition:
+            if generation != self.__generation:
+                # position changed while decoding, the chunk is outdated
+                return True
+            if len(samples) == 0 and len(output) == 0:
+                self.__eof = True
+                return False
+            if len(output):
+                self.__ring.put(AudioChunk(output, src_start, src_step=speed, generation=generation))
+            self.__read_pos = read_pos + len(samples)
+        return True
+
+    def __process(self, samples, read_pos, semitones, speed, generation):
+        if not semitones and speed == 1.0:
+            return samples, read_pos
+        if self.__processor_generation != generation:
+            # processing state doesn't carry over seeks
+            self.__processor = PitchTempoShifter(self.__channels, semitones, speed)
+            self.__processor_generation = generation
+        if len(samples) == 0:
+            return self.__processor.flush()
+        return self.__processor.process(samples, read_pos)
+
+    def __get_loop_cache(self, loop):
+        if loop is None or (loop[1] - loop[0]) > StreamEngine.LOOP_CACHE_SECONDS * self.__sample_rate:
+            return None
+        loop_cache = self.__loop_cache
+        if loop_cache is None:
+            self.__file.seek(loop[0])
+            loop_cache = self.__file.read(loop[1] - loop[0], dtype='float32', always_2d=True)
+            self.__file_pos = loop[0] + len(loop_cache)
+            with self.__ring.condition:
+                if loop is self.__loop:
+                    self.__loop_cache = loop_cache
+        return loop_cache
+
+    def __callback(self, outdata, frames, time, status):
+        if self.__paused:
+            outdata.fill(0)
+            return
+        lead = min(self.__count_in, frames)
+        if lead:
+            outdata[:lead].fill(0)
+            self.__count_in -= lead
+        if lead < frames:
+            self.__fill_track(outdata[lead:], frames - lead)
+        metronome = self.__metronome
+        if metronome is not None:
+            metronome.mix(outdata, frames, time.outputBufferDacTime if time is not None else None, force=lead > 0)
+
+    def __fill_track(self, outdata, frames):
+        if self.__file is None:
+            outdata.fill(0)
+            return
+        filled = 0
+        while filled < frames:
+            if self.__chunk is None or self.__chunk.generation != self.__generation:
+                self.__chunk = self.__ring.pop()
+                self.__chunk_offset = 0
+                if self.__chunk is None:
+                    # end of track or decoder underrun
+                    outdata[filled:].fill(0)
+                    return
+            chunk = self.__chunk
+            count = min(frames - filled, len(chunk.samples) - self.__chunk_offset)
+            outdata[filled:filled + count] = chunk.samples[self.__chunk_offset:self.__chunk_offset + count]
+            filled += count
+            self.__chunk_offset += count
+            self.__position = chunk.src_start + self.__chunk_offset * chunk.src_step
+            if self.__chunk_offset >= len(chunk.samples):
+                self.__chunk = None
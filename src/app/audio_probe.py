@@ -0,0 +1,191 @@
+"""
+Audio duration probing based on file headers only (no decoding).
+Supported formats: MP3 (Xing/Info, VBRI or frame scan), OGG (Vorbis/Opus), WAV and FLAC.
+Results are cached by file path, modification time and size.
+"""
+import mmap
+import os
+import struct
+import threading
+
+_MP3_BITRATES = {
+    # (version is MPEG-1, layer) -> kbps by index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def probe_duration(path):
+    """Returns audio duration in seconds or None if the format isn't recognized"""
+    stat = os.stat(path)
+    cache_key = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == cache_key:
+            return cached[1]
+    duration = None
+    if stat.st_size > 0:
+        with open(path, 'rb') as input_file:
+            with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                duration = _probe(data)
+    with _cache_lock:
+        _cache[path] = (cache_key, duration)
+    return duration
+
+
+def _probe(data):
+    start = _skip_id3v2(data)
+    magic = data[start:start + 4]
+    try:
+        if magic == b'RIFF':
+            return _probe_wav(data)
+        if magic == b'fLaC':
+            return _probe_flac(data, start)
+        if magic == b'OggS':
+            return _probe_ogg(data)
+        return _probe_mp3(data, start)
+    except (struct.error, IndexError, ZeroDivisionError):
+        return None
+
+
+def _skip_id3v2(data):
+    if data[0:3] != b'ID3' or len(data) < 10:
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+
+def _probe_wav(data):
+    if data[8:12] != b'WAVE':
+        return None
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(data):
+        chunk_id = data[pos:pos + 4]
+        chunk_size, = struct.unpack_from('<I', data, pos + 4)
+        if chunk_id == b'fmt ':
+            byte_rate, = struct.unpack_from('<I', data, pos + 16)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            # streamed files may have invalid data size, limit it by the real file size
+            data_size = min(chunk_size, len(data) - pos - 8)
+            return data_size / byte_rate
+        pos += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+
+def _probe_flac(data, start):
+    pos = start + 4
+    while pos + 4 <= len(data):
+        header = data[pos]
+        block_type = header & 0x7f
+        block_len = int.from_bytes(data[pos + 1:pos + 4], 'big')
+        if block_type == 0:
+            info = int.from_bytes(data[pos + 14:pos + 22], 'big')
+            sample_rate = info >> 44
+            total_samples = info & 0xfffffffff
+            if sample_rate == 0 or total_samples == 0:
+                return None
+            return total_samples / sample_rate
+        if header & 0x80:
+            break
+        pos += 4 + block_len
+    return None
+
+
+def _probe_ogg(data):
+    first_packet = 27 + data[26]
+    head = data[first_packet:first_packet + 19]
+    if head.startswith(b'\x01vorbis'):
+        sample_rate, = struct.unpack_from('<I', head, 12)
+        pre_skip = 0
+    elif head.startswith(b'OpusHead'):
+        pre_skip, = struct.unpack_from('<H', head, 10)
+        sample_rate = 48000
+    else:
+        return None
+    last_page = data.rfind(b'OggS', max(0, len(data) - 65536 * 2))
+    if last_page < 0:
+        return None
+    granule, = struct.unpack_from('<q', data, last_page + 6)
+    if granule <= 0:
+        return None
+    return max(0, granule - pre_skip) / sample_rate
+
+
+def _parse_mp3_header(data, pos):
+    """Returns (frame length, samples per frame, sample rate, mpeg1, mono) or None"""
+    if pos + 4 > len(data):
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    if data[pos] != 0xff or (b1 & 0xe0) != 0xe0:
+        return None
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    mono = (b3 >> 6) == 3
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate, mpeg1, mono
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate, mpeg1, mono
+
+
+def _find_mp3_frame(data, pos, limit=65536):
+    end = min(len(data), pos + limit)
+    while pos < end:
+        pos = data.find(b'\xff', pos, end)
+        if pos < 0:
+            return -1, None
+        header = _parse_mp3_header(data, pos)
+        # require the next frame to be valid as well, to skip false sync words
+        if header and (pos + header[0] >= len(data) or _parse_mp3_header(data, pos + header[0])):
+            return pos, header
+        pos += 1
+    return -1, None
+
+
+def _probe_mp3(data, start):
+    pos, header = _find_mp3_frame(data, start)
+    if header is None:
+        return None
+    frame_len, samples, sample_rate, mpeg1, mono = header
+
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = pos + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack_from('>I', data, xing + 4)
+        if flags & 1:
+            frames, = struct.unpack_from('>I', data, xing + 8)
+            return frames * samples / sample_rate
+    vbri = pos + 4 + 32
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames, = struct.unpack_from('>I', data, vbri + 14)
+        return frames * samples / sample_rate
+
+    # no VBR header - walk through frame headers
+    total_samples = 0
+    while header is not None:
+        total_samples += header[1]
+        next_pos = pos + header[0]
+        header = _parse_mp3_header(data, next_pos)
+        if header is None and data[next_pos:next_pos + 3] != b'TAG':
+            next_pos, header = _find_mp3_frame(data, next_pos + 1, limit=4096)
+        pos = next_pos
+    return total_samples / sample_rate
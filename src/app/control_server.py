@@ -0,0 +1,208 @@
+import json
+import threading
+from collections import deque
+from time import monotonic
+
+
+class ControlServer:
+    """
+    Local remote control of the application (foot pedal, MIDI controller, phone).
+    Clients connect over TCP on localhost and send commands one per line (e.g. `next`, `seek 42.5`),
+    MIDI messages are mapped to the same commands. Commands are injected into the UI loop as window events,
+    so nothing polls on the UI thread. The application acknowledges each command after the window is redrawn,
+    the acknowledgement carries the latency from receiving the command.
+    State published by the application and the player position are sent to all clients as json lines.
+    The server runs its own asyncio loop on a daemon thread, MIDI input uses the mido callback thread.
+    asyncio and mido are imported when the server is started, so the module costs nothing at start-up.
+    """
+    EVENT_COMMAND = 'CONTROL_COMMAND'
+    COMMANDS = ('next', 'prev', 'pause', 'stop', 'skip', 'seek', 'page', 'zoom_in', 'zoom_out', 'state')
+    DEF_HOST = '127.0.0.1'
+    # player position is sent to clients with this rate (Hz), only when it changes
+    POSITION_RATE = 10
+    LATENCY_SAMPLES = 1000
+    # clients not reading their messages are disconnected
+    MAX_CLIENT_BUFFER = 64 * 1024
+    # pedals send the sustain (64), sostenuto (66) and soft (67) controllers
+    DEF_MIDI_MAP = {'cc:64': 'next', 'cc:67': 'prev', 'cc:66': 'pause'}
+
+    def __init__(self, window, get_position, port=None, host=DEF_HOST, midi_input=None, midi_map=None):
+        self.__window = window
+        self.__get_position = get_position
+        self.__port = port
+        self.__host = host
+        self.__midi_input = midi_input
+        self.__midi_map = midi_map or ControlServer.DEF_MIDI_MAP
+        self.__midi_port = None
+        self.__midi_values = {}
+        self.__loop = None
+        self.__clients = {}
+        self.__next_client = 0
+        self.__state = {}
+        self.__latencies = deque(maxlen=ControlServer.LATENCY_SAMPLES)
+        self.__lock = threading.Lock()
+        self.__started = threading.Event()
+        self.__error = None
+        self.__thread = None
+
+    def start(self):
+        """Starts listening, raises an exception if the port or the MIDI input can't be opened"""
+        if self.__midi_input is not None:
+            try:
+                import mido
+            except ImportError:
+                raise Exception('MIDI input requires mido package (pip install mido python-rtmidi)')
+            # empty name opens the default input
+            self.__midi_port = mido.open_input(self.__midi_input or None, callback=self.__on_midi)
+        if self.__port is not None:
+            self.__thread = threading.Thread(target=self.__run, name='control-server', daemon=True)
+            self.__thread.start()
+            self.__started.wait()
+            if self.__error is not None:
+                raise Exception(f'Cannot start control server on port {self.__port}: {self.__error}')
+
+    def stop(self):
+        if self.__midi_port is not None:
+            self.__midi_port.close()
+            self.__midi_port = None
+        loop = self.__loop
+        if loop is not None and self.__thread.is_alive():
+            loop.call_soon_threadsafe(loop.stop)
+            self.__thread.join()
+
+    def inject(self, command, argument=None, received=None, client=None):
+        """Queues the command for the UI loop"""
+        self.__window.write_event_value(ControlServer.EVENT_COMMAND,
+                                        (command, argument, received or monotonic(), client))
+
+    def publish(self, state):
+        """Sends the state fields which changed to all clients (called on the UI thread)"""
+        with self.__lock:
+            changes = {key: value for key, value in state.items() if self.__state.get(key) != value}
+            self.__state.update(changes)
+        if changes:
+            self.__send(None, changes)
+
+    def acknowledge(self, client, command, latency, error=None):
+        """Records the latency (in seconds) of the handled command and reports it to the client"""
+        with self.__lock:
+            self.__latencies.append(latency)
+        message = {'ack': command, 'latency_ms': round(latency * 1000, 1)}
+        if error is not None:
+            message['error'] = str(error)
+        if client is not None:
+            self.__send(client, message)
+
+    def get_latency_stats(self):
+        """Returns (commands, mean latency, max latency) in seconds, None without commands"""
+        with self.__lock:
+            if not self.__latencies:
+                return None
+            latencies = list(self.__latencies)
+        return len(latencies), sum(latencies) / len(latencies), max(latencies)
+
+    def __send(self, client, message):
+        """Sends the message to the client (to all clients if None), may be called from any thread"""
+        loop = self.__loop
+        if loop is None or loop.is_closed():
+            return
+        line = json.dumps(message).encode() + b'\n'
+        try:
+            loop.call_soon_threadsafe(self.__write, client, line)
+        except RuntimeError:
+            # loop closed in the meantime
+            pass
+
+    def __write(self, client, line):
+        writers = [self.__clients.get(client)] if client is not None else list(self.__clients.values())
+        for writer in writers:
+            if writer is None or writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > ControlServer.MAX_CLIENT_BUFFER:
+                writer.close()
+                continue
+            writer.write(line)
+
+    def __run(self):
+        import asyncio
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            server = loop.run_until_complete(asyncio.start_server(self.__handle_client, self.__host, self.__port))
+        except OSError as ex:
+            self.__error = ex
+            loop.close()
+            self.__started.set()
+            return
+        self.__loop = loop
+        self.__started.set()
+        position_task = loop.create_task(self.__publish_position())
+        try:
+            loop.run_forever()
+        finally:
+            position_task.cancel()
+            server.close()
+            for writer in self.__clients.values():
+                writer.close()
+            loop.run_until_complete(server.wait_closed())
+            loop.close()
+
+    async def __handle_client(self, reader, writer):
+        client = self.__next_client
+        self.__next_client += 1
+        self.__clients[client] = writer
+        with self.__lock:
+            state = dict(self.__state)
+        writer.write(json.dumps(state).encode() + b'\n')
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                received = monotonic()
+                words = line.decode(errors='replace').split()
+                if not words:
+                    continue
+                command = words[0].lower()
+                if command == 'stats':
+                    stats = self.get_latency_stats()
+                    writer.write(json.dumps({'commands': stats[0], 'mean_ms': round(stats[1] * 1000, 1),
+                                             'max_ms': round(stats[2] * 1000, 1)} if stats else {}).encode() + b'\n')
+                elif command in ControlServer.COMMANDS:
+                    self.inject(command, words[1] if len(words) > 1 else None, received, client)
+                else:
+                    writer.write(json.dumps({'error': f'Unknown command {command}'}).encode() + b'\n')
+        except ConnectionError:
+            pass
+        finally:
+            del self.__clients[client]
+            writer.close()
+
+    async def __publish_position(self):
+        import asyncio
+        last_position = None
+        while True:
+            await asyncio.sleep(1.0 / ControlServer.POSITION_RATE)
+            if not self.__clients:
+                continue
+            position = round(self.__get_position(), 2)
+            if position != last_position:
+                last_position = position
+                self.__write(None, json.dumps({'position': position}).encode() + b'\n')
+
+    def __on_midi(self, message):
+        received = monotonic()
+        if message.type == 'control_change':
+            key = f'cc:{message.control}'
+            # pedal press is the controller value crossing the middle
+            is_press = message.value >= 64 > self.__midi_values.get(key, 0)
+            self.__midi_values[key] = message.value
+        elif message.type == 'note_on':
+            key = f'note:{message.note}'
+            is_press = message.velocity > 0
+        else:
+            return
+        command = self.__midi_map.get(key)
+        if command is not None and is_press:
+            words = command.split()
+            self.inject(words[0], words[1] if len(words) > 1 else None, received)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+from .documents import write_json
+from .pdf import _fitz
+
+
+class DiskRenderCache:
+    """
+    Persistent cache of rendered PDF pages, shared between sessions.
+    Pages are content-addressed: file name is a hash of the PDF content hash and render parameters,
+    so renamed or moved PDF files still hit the cache. Files hold raw pixel data and are read
+    with memory mapping. Total size is limited, least recently used files are evicted first.
+    """
+    DEF_DIR = os.getenv('HOME') + '/.music-practice/cache'
+    DEF_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    FILE_EXT = '.page'
+    HEADER = struct.Struct('<4sIIB')
+    MAGIC = b'MPHP'
+    HASHES_FILE = 'hashes.json'
+    VIEW_FILE = 'view.json'
+
+    def __init__(self, directory=DEF_DIR, max_bytes=DEF_MAX_BYTES):
+        self.__directory = directory
+        self.__max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__files = None
+        self.__size = 0
+        self.__hashes = None
+
+    def file_hash(self, path):
+        """Content hash of the file, memoized by path, modification time and size"""
+        stat = os.stat(path)
+        with self.__lock:
+            if self.__hashes is None:
+                self.__hashes = self.__read_json(DiskRenderCache.HASHES_FILE, {})
+            known = self.__hashes.get(path)
+            if known and known[0] == stat.st_mtime_ns and known[1] == stat.st_size:
+                return known[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        with self.__lock:
+            self.__hashes[path] = [stat.st_mtime_ns, stat.st_size, content_hash]
+            self.__write_json(DiskRenderCache.HASHES_FILE, self.__hashes)
+        return content_hash
+
+    def get(self, key):
+        file_path = self.__file_path(key)
+        try:
+            with open(file_path, 'rb') as input_file:
+                with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    magic, width, height, n = DiskRenderCache.HEADER.unpack_from(data)
+                    if magic != DiskRenderCache.MAGIC:
+                        return None
+                    fitz = _fitz()
+                    colorspace = fitz.csGRAY if n == 1 else fitz.csRGB
+                    # PyMuPDF accepts only bytes, samples are copied once straight from the mapped pages
+                    pixmap = fitz.Pixmap(colorspace, width, height, data[DiskRenderCache.HEADER.size:], False)
+            # modification time is used as the last access time for LRU eviction
+            os.utime(file_path)
+            return pixmap
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def put(self, key, pixmap):
+        file_path = self.__file_path(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as output_file:
+            output_file.write(DiskRenderCache.HEADER.pack(DiskRenderCache.MAGIC, pixmap.width, pixmap.height,
+                                                          pixmap.n))
+            output_file.write(pixmap.samples_mv)
+        os.replace(tmp_path, file_path)
+        with self.__lock:
+            if self.__files is None:
+                self.__scan()
+            file_size = os.path.getsize(file_path)
+            self.__size += file_size - self.__files.get(file_path, 0)
+            self.__files[file_path] = file_size
+            if self.__size > self.__max_bytes:
+                self.__evict()
+
+    def save_view_size(self, view_size):
+        """Stores the last PDF panel size of the application, used to warm up the cache"""
+        with self.__lock:
+            self.__write_json(DiskRenderCache.VIEW_FILE, list(view_size))
+
+    def load_view_size(self):
+        with self.__lock:
+            view_size = self.__read_json(DiskRenderCache.VIEW_FILE, None)
+        return tuple(view_size) if view_size else None
+
+    def __file_path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.__directory, name[:2], name + DiskRenderCache.FILE_EXT)
+
+    def __scan(self):
+        self.__files = {}
+        self.__size = 0
+        if not os.path.isdir(self.__directory):
+            return
+        for shard in os.scandir(self.__directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(DiskRenderCache.FILE_EXT):
+                    size = entry.stat().st_size
+                    self.__files[entry.path] = size
+                    self.__size += size
+
+    def __evict(self):
+        # evict down to 90% of the limit, so eviction doesn't run on each put
+        by_access_time = sorted(self.__files, key=lambda path: DiskRenderCache.__mtime(path))
+        for path in by_access_time:
+            if self.__size <= 0.9 * self.__max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.__size -= self.__files.pop(path)
+
+    @staticmethod
+    def __mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def __read_json(self, name, default):
+        try:
+            with open(os.path.join(self.__directory, name)) as input_file:
+                return json.load(input_file)
+        except (OSError, ValueError):
+            return default
+
+    def __write_json(self, name, value):
+        write_json(os.path.join(self.__directory, name), value)
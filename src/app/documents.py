@@ -1,5 +1,11 @@
 import json
 import os
+import shutil
+import threading
+
+from .entry_index import EntryIndex
+from .path_resolver import PathResolver
+from .sqlite_store import SqliteStore
 
 
 class DocumentEntry:
@@ -11,9 +17,153 @@ class DocumentEntry:
         self.is_pdf = is_pdf
         self.tags = tags
         self.page_num = page_num
+        # paths of missing files, set by the library health check
+        self.missing = []
 
     def __str__(self):
-        return self.name
+        return f'{self.name} (missing file)' if self.missing else self.name
+
+
+class JsonStore:
+    """
+    Database kept in a json file. Changes are appended to a journal file (one json line per change),
+    which is replayed over the base file on load. Once the journal grows above the threshold,
+    a new base file is written in the background (temp file and rename) and the journal is truncated.
+    """
+    JOURNAL_EXT = '.journal'
+    COMPACT_THRESHOLD = 64 * 1024
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.journal_path = file_path + JsonStore.JOURNAL_EXT
+        self.documents = None
+        self.__journal = None
+        # end of the last complete journal line, a torn line after it is cut off before the next append
+        self.__journal_end = None
+        self.__lock = threading.Lock()
+        self.__compaction = None
+
+    def load(self):
+        with open(self.file_path) as input_file:
+            self.documents = json.load(input_file)
+        self.__journal_end = None
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'rb') as journal:
+                end = 0
+                for line in journal:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError('incomplete line')
+                        change = json.loads(line)
+                    except ValueError:
+                        # incomplete last line after a crash
+                        break
+                    self.documents['items'][change['key']] = change['value']
+                    end += len(line)
+                if end < journal.seek(0, os.SEEK_END):
+                    self.__journal_end = end
+
+    def get_paths(self):
+        return self.documents['paths']
+
+    def get_settings(self):
+        return self.documents.get('settings', {})
+
+    def get_summaries(self):
+        """Yields (code, name, is_audio, is_pdf, tags, page_num) of all items"""
+        for key, doc in self.documents['items'].items():
+            yield key, doc['name'], 'audio' in doc, 'pdf' in doc, list(doc.get('tags', [])), doc.get('page_num')
+
+    def get_item(self, key):
+        return self.documents['items'].get(key)
+
+    def get_items(self):
+        return self.documents['items']
+
+    def put_item(self, key, value):
+        line = json.dumps({'key': key, 'value': value}).encode() + b'\n'
+        with self.__lock:
+            self.documents['items'][key] = value
+            if self.__journal is None:
+                if self.__journal_end is not None:
+                    os.truncate(self.journal_path, self.__journal_end)
+                    self.__journal_end = None
+                self.__journal = open(self.journal_path, 'ab')
+            self.__journal.write(line)
+            self.__journal.flush()
+            os.fsync(self.__journal.fileno())
+            journal_size = self.__journal.tell()
+        if journal_size > JsonStore.COMPACT_THRESHOLD and not self.__is_compacting():
+            self.__compaction = threading.Thread(target=self.compact, name='documents-compaction', daemon=True)
+            self.__compaction.start()
+
+    def to_json(self):
+        return self.documents
+
+    def close(self):
+        """Writes pending journal changes into the base file, so it can be edited by hand again"""
+        if self.__is_compacting():
+            self.__compaction.join()
+        # also a journal left by a crashed session, which was replayed on load
+        if self.documents is not None and os.path.exists(self.journal_path) \
+                and os.path.getsize(self.journal_path) > 0:
+            self.compact()
+        with self.__lock:
+            if self.__journal is not None:
+                self.__journal.close()
+                self.__journal = None
+
+    def compact(self):
+        """Writes journal changes into the base file"""
+        with self.__lock:
+            content = json.dumps(self.documents, indent=2)
+            journal_offset = self.__journal.tell() if self.__journal else 0
+        tmp_path = self.file_path + '.tmp'
+        with open(tmp_path, 'w') as output_file:
+            output_file.write(content)
+            output_file.flush()
+            os.fsync(output_file.fileno())
+        self.__rotate_backups()
+        os.replace(tmp_path, self.file_path)
+        with self.__lock:
+            # keep changes appended while the base file was written
+            remaining = b''
+            self.__journal_end = None
+            if self.__journal is not None:
+                self.__journal.close()
+                self.__journal = None
+                with open(self.journal_path, 'rb') as journal:
+                    journal.seek(journal_offset)
+                    remaining = journal.read()
+            with open(tmp_path, 'wb') as journal:
+                journal.write(remaining)
+                journal.flush()
+                os.fsync(journal.fileno())
+            os.replace(tmp_path, self.journal_path)
+
+    def __is_compacting(self):
+        return self.__compaction is not None and self.__compaction.is_alive()
+
+    def __rotate_backups(self):
+        n_backups = 3
+        backup_extensions = list(reversed([f'.bak{n+1}' for n in range(n_backups)]))
+        next_backup_ext = None
+        for index, ext in enumerate(backup_extensions):
+            if index == 0 and os.path.exists(self.file_path + ext):
+                os.remove(self.file_path + ext)
+            if next_backup_ext and os.path.exists(self.file_path + ext):
+                os.rename(self.file_path + ext, self.file_path + next_backup_ext)
+            next_backup_ext = ext
+        shutil.copyfile(self.file_path, self.file_path + next_backup_ext)
+
+
+def write_json(file_path, value):
+    """Writes the value into the json file atomically (temp file and rename), creates missing directories"""
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    tmp_path = f'{file_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as output_file:
+        json.dump(value, output_file)
+    os.replace(tmp_path, file_path)
 
 
 class Documents:
@@ -23,74 +173,106 @@ class Documents:
      * audio file path
      * or both paths
     Document locations are stored in local json file 'documents.json'
+    or in SQLite database 'documents.db' (preferred if both exist in the same location)
     """
     FILE_NAME = 'documents.json'
+    DB_FILE_NAME = 'documents.db'
 
     def __init__(self):
-        self.documents = None
+        self.store = None
         self.tools = {}
         self.paths = {}
         self.source_path = None
+        self.__index = None
+        self.__resolver = PathResolver({})
 
     def load(self):
         locations = ['.', os.getenv('HOME') + '/.music-practice']
         for location in locations:
+            db_path = f'{location}/{Documents.DB_FILE_NAME}'
             file_path = f'{location}/{Documents.FILE_NAME}'
+            if os.path.isfile(db_path):
+                self.store = SqliteStore(db_path)
+                self.source_path = db_path
+                break
             if os.path.isfile(file_path):
-                with open(file_path) as input_file:
-                    self.source_path = file_path
-                    self.documents = json.load(input_file)
+                self.store = JsonStore(file_path)
+                self.source_path = file_path
                 break
 
-        if self.documents is None:
+        if self.store is None:
             raise Exception(f'Cannot find database file {Documents.FILE_NAME}')
 
-        self.paths = self.documents['paths']
+        self.store.load()
+        self.paths = self.store.get_paths()
+        self.__resolver = PathResolver(self.paths)
+        self.__index = EntryIndex(Documents.__make_entry(*summary) for summary in self.store.get_summaries())
+
+    @staticmethod
+    def __make_entry(key, name, is_audio, is_pdf, tags, page_num):
+        is_audio_only = ' (audio only)' if is_audio and not is_pdf else ''
+        is_pdf_only = ' (pdf only)' if is_pdf and not is_audio else ''
+        return DocumentEntry(key, name=f"{name}{is_audio_only}{is_pdf_only}",
+                             is_audio=is_audio, is_pdf=is_pdf, tags=tags, page_num=page_num)
 
     def get_entries(self):
-        output = []
-        for key in self.documents['items'].keys():
-            doc = self.documents['items'][key]
-            is_audio = 'audio' in doc
-            is_pdf = 'pdf' in doc
-            is_audio_only = ' (audio only)' if is_audio and not is_pdf else ''
-            is_pdf_only = ' (pdf only)' if is_pdf and not is_audio else ''
-            tags = list(doc['tags']) if 'tags' in doc else []
-            page_num = doc['page_num'] if 'page_num' in doc else None
-            output.append(DocumentEntry(key, name=f"{doc['name']}{is_audio_only}{is_pdf_only}",
-                          is_audio=is_audio, is_pdf=is_pdf, tags=tags, page_num=page_num))
-        return sorted(output, key=lambda item: item.name)
+        return self.__index.entries()
 
+    def filter_entries(self, tags=None, audio=None, pdf=None):
+        return self.__index.filter(tags=tags, audio=audio, pdf=pdf)
 
     def update_entry(self, key, value):
-        self.documents['items'][key] = value
-        self.__save_documents()
+        self.store.put_item(key, value)
+        entry = Documents.__make_entry(key, value['name'], 'audio' in value, 'pdf' in value,
+                                       list(value.get('tags', [])), value.get('page_num'))
+        entry.missing = self.find_missing(value)
+        self.__index.put(entry)
 
+    def expand_path(self, path):
+        return self.__resolver.resolve(path)
 
-    def __save_documents(self):
-        n_backups = 3
-        backup_extensions = list(reversed([f'.bak{n+1}' for n in range(n_backups)]))
-        backup_extensions.append('') # file itself
-        next_backup_ext = None
-        for index, ext in enumerate(backup_extensions):
-            if index == 0 and os.path.exists(self.source_path + ext):
-                os.remove(self.source_path + ext)
-            if next_backup_ext and os.path.exists(self.source_path + ext):
-                os.rename(self.source_path + ext, self.source_path + next_backup_ext)
-            next_backup_ext = ext
-        with open(self.source_path, 'w') as output_file:
-            json.dump(self.documents, output_file, indent=2)
+    def find_missing(self, item):
+        """Returns expanded paths of files of the item which don't exist"""
+        paths = [self.expand_path(item[field]) for field in ('pdf', 'audio') if item.get(field)]
+        return [path for path in paths if not os.path.isfile(path)]
 
-    def expand_path(self, path):
-        res = path
-        for key, value in self.paths.items():
-            if key in path:
-                res = res.replace(key, value)
-                print('replaced', res)
-        return res
+    def set_missing(self, missing):
+        """Flags entries with missing files, missing is {code: [missing paths]}"""
+        for entry in self.__index.entries():
+            entry.missing = missing.get(entry.code, [])
+
+    def get_item(self, key):
+        return self.store.get_item(key)
+
+    def get_setting(self, name, default=None):
+        """Global setting from 'settings' section of the database"""
+        return self.store.get_settings().get(name, default)
 
     def get_items(self):
-        return self.documents['items']
+        return self.store.get_items()
 
     def get_tools(self):
         return self.tools
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    @staticmethod
+    def import_json(json_path, db_path):
+        """Creates SQLite database from the json file"""
+        with open(json_path) as input_file:
+            documents = json.load(input_file)
+        store = SqliteStore(db_path)
+        store.import_json(documents)
+        store.close()
+
+    @staticmethod
+    def export_json(db_path, json_path):
+        """Writes content of SQLite database in the json file format"""
+        store = SqliteStore(db_path)
+        store.load()
+        documents = store.to_json()
+        store.close()
+        with open(json_path, 'w') as output_file:
+            json.dump(documents, output_file, indent=2)
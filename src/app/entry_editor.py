@@ -11,6 +11,13 @@ class EntryEditor:
     field_alto = "FIELD_ALTO"
     field_tenor = "FIELD_TENOR"
     field_page_num = "FIELD_PAGE_NUM"
+    field_render_mode = "FIELD_RENDER_MODE"
+    field_transpose = "FIELD_TRANSPOSE"
+    field_bpm = "FIELD_BPM"
+    field_time_signature = "FIELD_TIME_SIGNATURE"
+    time_signatures = ['', '2/4', '3/4', '4/4', '5/4', '6/8', '7/8', '12/8']
+    # empty value means the global setting
+    render_modes = ['', 'auto', 'rgb', 'gray', 'mono']
     initial_folder = getcwd()
 
     def __init__(self):
@@ -23,6 +30,12 @@ class EntryEditor:
             [sg.Text('Audio'), sg.InputText('', key=EntryEditor.field_audio), self.audio_browser],
             [sg.Text('Tags'), sg.Checkbox('Alto', key=EntryEditor.field_alto), sg.Checkbox('Tenor', key=EntryEditor.field_tenor)],
             [sg.Text('Start page #'), sg.InputText('', key=EntryEditor.field_page_num)],
+            [sg.Text('PDF colors'), sg.Combo(EntryEditor.render_modes, default_value='', readonly=True,
+                                             key=EntryEditor.field_render_mode)],
+            [sg.Text('Transpose (semitones)'), sg.InputText('', size=(5, 1), key=EntryEditor.field_transpose)],
+            [sg.Text('Tempo (BPM)'), sg.InputText('', size=(5, 1), key=EntryEditor.field_bpm),
+             sg.Text('Time signature'), sg.Combo(EntryEditor.time_signatures, default_value='', readonly=True,
+                                                 key=EntryEditor.field_time_signature)],
             [sg.Button('Save'), sg.Button('Cancel')]
         ]
 
@@ -48,6 +61,14 @@ class EntryEditor:
                 new_entry['page_num'] = page_num
             else:
                 new_entry.pop('page_num', None)
+            if values[EntryEditor.field_render_mode]:
+                new_entry['render_mode'] = values[EntryEditor.field_render_mode]
+            if values[EntryEditor.field_transpose].strip() and int(values[EntryEditor.field_transpose]) != 0:
+                new_entry['transpose'] = int(values[EntryEditor.field_transpose])
+            if values[EntryEditor.field_bpm].strip():
+                new_entry['bpm'] = int(values[EntryEditor.field_bpm])
+            if values[EntryEditor.field_time_signature]:
+                new_entry['time_signature'] = values[EntryEditor.field_time_signature]
             EntryEditor.initial_folder = os.path.dirname(
                 values[EntryEditor.field_pdf] or values[EntryEditor.field_audio])
             window.close()
@@ -63,6 +84,10 @@ class EntryEditor:
             window[EntryEditor.field_alto].update(value='alto' in entry_value['tags'])
             window[EntryEditor.field_tenor].update(value='tenor' in entry_value['tags'])
         window[EntryEditor.field_page_num].update(value=str(entry_value['page_num']+1) if 'page_num' in entry_value else '')
+        window[EntryEditor.field_render_mode].update(value=entry_value.get('render_mode', ''))
+        window[EntryEditor.field_transpose].update(value=str(entry_value['transpose']) if 'transpose' in entry_value else '')
+        window[EntryEditor.field_bpm].update(value=str(entry_value['bpm']) if 'bpm' in entry_value else '')
+        window[EntryEditor.field_time_signature].update(value=entry_value.get('time_signature', ''))
         window.refresh()
         event, values = window.read()
         if event == 'Save':
@@ -72,17 +97,35 @@ class EntryEditor:
                 tags.append('Alto')
             if values[EntryEditor.field_tenor]:
                 tags.append('Tenor')
-            entry_value = {
+            # keep fields not handled by the editor
+            entry_value = dict(entry_value)
+            entry_value.update({
                 'name': values[EntryEditor.field_name],
                 'pdf': values[EntryEditor.field_pdf] or '',
                 'audio': values[EntryEditor.field_audio] or '',
                 'tags': [tag.lower().strip() for tag in tags]
-            }
+            })
             page_num = max(int(values[EntryEditor.field_page_num]) - 1, 0)
             if page_num > 0:
                 entry_value['page_num'] = page_num
             else:
                 entry_value.pop('page_num', None)
+            if values[EntryEditor.field_render_mode]:
+                entry_value['render_mode'] = values[EntryEditor.field_render_mode]
+            else:
+                entry_value.pop('render_mode', None)
+            if values[EntryEditor.field_transpose].strip() and int(values[EntryEditor.field_transpose]) != 0:
+                entry_value['transpose'] = int(values[EntryEditor.field_transpose])
+            else:
+                entry_value.pop('transpose', None)
+            if values[EntryEditor.field_bpm].strip():
+                entry_value['bpm'] = int(values[EntryEditor.field_bpm])
+            else:
+                entry_value.pop('bpm', None)
+            if values[EntryEditor.field_time_signature]:
+                entry_value['time_signature'] = values[EntryEditor.field_time_signature]
+            else:
+                entry_value.pop('time_signature', None)
             EntryEditor.initial_folder = os.path.dirname(
                 values[EntryEditor.field_pdf] or values[EntryEditor.field_audio])
             window.close()
@@ -98,3 +141,13 @@ class EntryEditor:
             num = int(values[EntryEditor.field_page_num])
             if num < 1:
                 raise Exception('Page number must be positive')
+        transpose = values[EntryEditor.field_transpose].strip()
+        if len(transpose) > 0:
+            if not transpose.lstrip('+-').isdigit():
+                raise Exception('Transposition must be a whole number of semitones')
+            if abs(int(transpose)) > 12:
+                raise Exception('Transposition must be within an octave (-12..12)')
+        bpm = values[EntryEditor.field_bpm].strip()
+        if len(bpm) > 0:
+            if not bpm.isdigit() or not 30 <= int(bpm) <= 300:
+                raise Exception('Tempo must be a number of beats per minute (30..300)')
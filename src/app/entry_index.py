@@ -0,0 +1,87 @@
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+
+class EntryIndex:
+    """
+    Sorted index of document entries with inverted indexes by tag and by audio/PDF flags.
+    Filtering is done with set operations, the sorted order is maintained in place on every update.
+    """
+
+    def __init__(self, entries=()):
+        self.__entries = {}
+        self.__sorted_keys = []
+        self.__sorted = []
+        self.__by_tag = defaultdict(set)
+        self.__audio = set()
+        self.__pdf = set()
+        for entry in entries:
+            self.__entries[entry.code] = entry
+            self.__add_to_sets(entry)
+        self.__sorted = sorted(self.__entries.values(), key=EntryIndex.__sort_key)
+        self.__sorted_keys = [EntryIndex.__sort_key(entry) for entry in self.__sorted]
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, code):
+        return self.__entries.get(code)
+
+    def put(self, entry):
+        self.remove(entry.code)
+        self.__entries[entry.code] = entry
+        self.__add_to_sets(entry)
+        sort_key = EntryIndex.__sort_key(entry)
+        position = bisect_left(self.__sorted_keys, sort_key)
+        self.__sorted_keys.insert(position, sort_key)
+        self.__sorted.insert(position, entry)
+
+    def remove(self, code):
+        entry = self.__entries.pop(code, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            self.__by_tag[tag.lower()].discard(code)
+        self.__audio.discard(code)
+        self.__pdf.discard(code)
+        position = bisect_left(self.__sorted_keys, EntryIndex.__sort_key(entry))
+        del self.__sorted_keys[position]
+        del self.__sorted[position]
+
+    def entries(self):
+        return list(self.__sorted)
+
+    def filter(self, tags=None, audio=None, pdf=None):
+        """
+        Returns sorted entries having any of given tags and matching audio/PDF flags (None means any value)
+        """
+        codes = None
+        if tags:
+            codes = set().union(*(self.__by_tag.get(tag.lower(), ()) for tag in tags))
+        codes = EntryIndex.__apply_flag(codes, self.__audio, audio, self.__entries)
+        codes = EntryIndex.__apply_flag(codes, self.__pdf, pdf, self.__entries)
+        if codes is None:
+            return self.entries()
+        if len(codes) > len(self.__sorted) // 8:
+            return [entry for entry in self.__sorted if entry.code in codes]
+        return sorted((self.__entries[code] for code in codes), key=EntryIndex.__sort_key)
+
+    def __add_to_sets(self, entry):
+        for tag in entry.tags:
+            self.__by_tag[tag.lower()].add(entry.code)
+        if entry.is_audio:
+            self.__audio.add(entry.code)
+        if entry.is_pdf:
+            self.__pdf.add(entry.code)
+
+    @staticmethod
+    def __apply_flag(codes, flag_set, flag, all_entries):
+        if flag is None:
+            return codes
+        if codes is None:
+            return set(flag_set) if flag else all_entries.keys() - flag_set
+        return codes & flag_set if flag else codes - flag_set
+
+    @staticmethod
+    def __sort_key(entry):
+        return entry.name, entry.code
@@ -0,0 +1,73 @@
+import os
+import threading
+from collections import defaultdict
+from time import perf_counter
+
+
+class LibraryHealthCheck:
+    """
+    Checks that PDF and audio files of all entries exist. Files are checked in bulk: each directory
+    holding referenced files is listed once with os.scandir (on a thread pool, the work is mostly waiting
+    for the file system), instead of a stat call per file. Entries with missing (or moved) files are reported
+    as {code: [missing paths]}, the check can run on a background thread while the window is shown.
+    """
+    FIELDS = ('pdf', 'audio')
+    WORKERS = 8
+
+    def __init__(self, documents, workers=WORKERS):
+        self.__documents = documents
+        self.__workers = workers
+        self.checked = 0
+        self.elapsed = 0.0
+
+    def check(self):
+        """Returns entries with missing files {code: [missing paths]}"""
+        from concurrent.futures import ThreadPoolExecutor
+        start = perf_counter()
+        codes_by_path = defaultdict(list)
+        for code, item in self.__documents.get_items().items():
+            for field in LibraryHealthCheck.FIELDS:
+                if item.get(field):
+                    codes_by_path[os.path.normpath(self.__documents.expand_path(item[field]))].append(code)
+        names_by_dir = defaultdict(set)
+        for path in codes_by_path:
+            directory, name = os.path.split(path)
+            names_by_dir[directory].add(name)
+        missing = {}
+        with ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix='health') as executor:
+            for directory, names in zip(names_by_dir, executor.map(LibraryHealthCheck.__list_files, names_by_dir)):
+                for name in names_by_dir[directory] - names:
+                    path = os.path.join(directory, name)
+                    # names differing only in case on case-insensitive file systems
+                    if names and os.path.isfile(path):
+                        continue
+                    for code in codes_by_path[path]:
+                        missing.setdefault(code, []).append(path)
+        self.checked = len(codes_by_path)
+        self.elapsed = perf_counter() - start
+        return missing
+
+    def start(self, on_done):
+        """Runs the check on a daemon thread, on_done is called there with the result"""
+        thread = threading.Thread(target=lambda: on_done(self.check()), name='library-health', daemon=True)
+        thread.start()
+
+    @staticmethod
+    def __list_files(directory):
+        try:
+            with os.scandir(directory) as entries:
+                return {entry.name for entry in entries if entry.is_file()}
+        except OSError:
+            # missing directory (e.g. unmounted drive), all its files are missing
+            return set()
+
+
+def check_library(documents):
+    """Prints entries with missing files"""
+    health_check = LibraryHealthCheck(documents)
+    missing = health_check.check()
+    for code, paths in sorted(missing.items()):
+        for path in paths:
+            print(f'{code}: missing {path}')
+    print(f'{health_check.checked} files checked in {health_check.elapsed:.2f} s, '
+          f'{len(missing)} entries with missing files')
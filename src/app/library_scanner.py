@@ -0,0 +1,225 @@
+import json
+import os
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import perf_counter
+
+from .documents import write_json
+
+
+class ScanCache:
+    """
+    Listing of scanned directories: directory -> [mtime, media files, sub-directories].
+    Directory modification time changes when its entries are added, removed or renamed,
+    so listing of unchanged directories is taken from the cache and only their stat is checked.
+    """
+    DEF_FILE = os.getenv('HOME') + '/.music-practice/scan.json'
+
+    def __init__(self, file_path=DEF_FILE):
+        self.__file_path = file_path
+        self.dirs = {}
+
+    def load(self):
+        try:
+            with open(self.__file_path) as input_file:
+                self.dirs = json.load(input_file)
+        except (OSError, ValueError):
+            self.dirs = {}
+
+    def save(self):
+        write_json(self.__file_path, self.dirs)
+
+
+class LibraryScanner:
+    """
+    Finds PDF and audio files under the roots configured in `paths` of the database and proposes
+    new entries for files not used by any entry yet. Directories are scanned with os.scandir
+    on a thread pool (the work is mostly waiting for the file system).
+    Audio files are paired with PDF files by similarity of names and by folder.
+    """
+    AUDIO_EXT = ('.mp3', '.wav', '.ogg', '.flac', '.opus')
+    PDF_EXT = ('.pdf',)
+    TAGS = ('alto', 'tenor', 'soprano', 'baritone')
+    MIN_SIMILARITY = 0.35
+    SAME_FOLDER_BONUS = 0.3
+    NEAR_FOLDER_BONUS = 0.15
+    # tokens shared by so many files don't tell which files belong together
+    MAX_TOKEN_FILES = 200
+    WORKERS = 16
+
+    def __init__(self, documents, cache=None, workers=WORKERS):
+        self.__documents = documents
+        self.__cache = cache or ScanCache()
+        self.__workers = workers
+        self.listed = 0
+        self.reused = 0
+
+    def scan(self):
+        """Returns paths of all media files under the roots"""
+        self.__cache.load()
+        old_dirs = self.__cache.dirs
+        new_dirs = {}
+        files = []
+        # roots may be nested, each directory is scanned once
+        submitted = set(os.path.normpath(root) for root in self.__documents.paths.values())
+        with ThreadPoolExecutor(max_workers=self.__workers, thread_name_prefix='scan') as executor:
+            pending = {executor.submit(self.__scan_dir, root, old_dirs.get(root)) for root in submitted}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory, listing, reused = future.result()
+                    if listing is None:
+                        continue
+                    new_dirs[directory] = listing
+                    if reused:
+                        self.reused += 1
+                    else:
+                        self.listed += 1
+                    files.extend(os.path.join(directory, name) for name in listing[1])
+                    for name in listing[2]:
+                        path = os.path.join(directory, name)
+                        if path not in submitted:
+                            submitted.add(path)
+                            pending.add(executor.submit(self.__scan_dir, path, old_dirs.get(path)))
+        # directories removed since the last scan are dropped with the new listing
+        self.__cache.dirs = new_dirs
+        self.__cache.save()
+        return files
+
+    @staticmethod
+    def __scan_dir(directory, cached):
+        try:
+            mtime_ns = os.stat(directory).st_mtime_ns
+        except OSError:
+            return directory, None, False
+        if cached is not None and cached[0] == mtime_ns:
+            return directory, cached, True
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.name.lower().endswith(LibraryScanner.AUDIO_EXT + LibraryScanner.PDF_EXT):
+                        files.append(entry.name)
+        except OSError:
+            return directory, None, False
+        return directory, [mtime_ns, files, subdirs], False
+
+    def propose_entries(self, files=None):
+        """Proposes entries (code, item) for files not used by existing entries"""
+        files = self.scan() if files is None else files
+        used = set()
+        for item in self.__documents.get_items().values():
+            for field in ('pdf', 'audio'):
+                if item.get(field):
+                    used.add(os.path.normpath(self.__documents.expand_path(item[field])))
+        audio_files = [path for path in files if path.lower().endswith(LibraryScanner.AUDIO_EXT)]
+        pdf_files = [path for path in files if path.lower().endswith(LibraryScanner.PDF_EXT)]
+
+        pdf_tokens = [LibraryScanner.tokens(path) for path in pdf_files]
+        pdf_folders = [os.path.dirname(path) for path in pdf_files]
+        by_token = defaultdict(list)
+        by_folder = defaultdict(list)
+        for index, folder in enumerate(pdf_folders):
+            by_folder[folder].append(index)
+            for token in pdf_tokens[index]:
+                by_token[token].append(index)
+        # folders holding PDFs for their sub-folders or parent folder, e.g. a book with a folder of tracks
+        by_near_folder = defaultdict(list)
+        for folder, indexes in by_folder.items():
+            by_near_folder[os.path.dirname(folder)].extend(indexes)
+
+        codes = set(self.__documents.get_items().keys())
+        proposals = []
+        paired_pdfs = set()
+        for audio_path in audio_files:
+            if audio_path in used:
+                continue
+            pdf_index = self.__best_pdf(audio_path, pdf_tokens, by_token, by_folder, by_near_folder)
+            pdf_path = pdf_files[pdf_index] if pdf_index is not None else None
+            if pdf_path is not None:
+                paired_pdfs.add(pdf_path)
+            proposals.append(self.__make_entry(codes, audio_path, pdf_path))
+        for pdf_path in pdf_files:
+            if pdf_path not in used and pdf_path not in paired_pdfs:
+                proposals.append(self.__make_entry(codes, None, pdf_path))
+        return proposals
+
+    @staticmethod
+    def __best_pdf(audio_path, pdf_tokens, by_token, by_folder, by_near_folder):
+        tokens = LibraryScanner.tokens(audio_path)
+        folder = os.path.dirname(audio_path)
+        # number of tokens shared with each candidate, counted from the token index
+        shared = Counter()
+        for token in tokens:
+            token_files = by_token.get(token, ())
+            if len(token_files) <= LibraryScanner.MAX_TOKEN_FILES:
+                shared.update(token_files)
+        bonus = dict.fromkeys(by_near_folder.get(folder, ()), LibraryScanner.NEAR_FOLDER_BONUS)
+        bonus.update(dict.fromkeys(by_folder.get(os.path.dirname(folder), ()), LibraryScanner.NEAR_FOLDER_BONUS))
+        bonus.update(dict.fromkeys(by_folder.get(folder, ()), LibraryScanner.SAME_FOLDER_BONUS))
+        best, best_score = None, LibraryScanner.MIN_SIMILARITY
+        for index in shared.keys() | bonus.keys():
+            common = shared.get(index, 0)
+            union = len(tokens) + len(pdf_tokens[index]) - common
+            score = (common / union if union else 0.0) + bonus.get(index, 0.0)
+            if score > best_score:
+                best, best_score = index, score
+        return best
+
+    @staticmethod
+    def tokens(path):
+        """Lowercase words of the file name without extension"""
+        name = os.path.splitext(os.path.basename(path))[0]
+        return set(token for token in re.split(r'[^0-9a-z]+', name.lower()) if token)
+
+    def __make_entry(self, codes, audio_path, pdf_path):
+        path = audio_path or pdf_path
+        name = re.sub(r'[\s_+]+', ' ', os.path.splitext(os.path.basename(path))[0]).strip()
+        code = base_code = re.sub(r'[^0-9a-z]+', '_', name.lower()).strip('_') or 'entry'
+        number = 2
+        while code in codes:
+            code = f'{base_code}_{number}'
+            number += 1
+        codes.add(code)
+        words = set(re.split(r'[^0-9a-z]+', (audio_path or '').lower() + ' ' + (pdf_path or '').lower()))
+        item = {'name': name}
+        # entries have the key only for files they use ('pdf' in item means a PDF entry)
+        if pdf_path:
+            item['pdf'] = self.__alias_path(pdf_path)
+        if audio_path:
+            item['audio'] = self.__alias_path(audio_path)
+        item['tags'] = [tag for tag in LibraryScanner.TAGS if tag in words]
+        return code, item
+
+    def __alias_path(self, path):
+        """Path relative to the longest matching root, prefixed with the root alias (as in documents.json)"""
+        best = None
+        for alias, root in self.__documents.paths.items():
+            root = os.path.normpath(root)
+            if path.startswith(root + os.sep) and (best is None or len(root) > len(best[1])):
+                best = (alias, root)
+        if best is None:
+            return path
+        return best[0] + '/' + os.path.relpath(path, best[1]).replace(os.sep, '/')
+
+
+def scan_library(documents, add=False):
+    """Prints entries proposed for new files found under the roots, adds them to the database if requested"""
+    start = perf_counter()
+    scanner = LibraryScanner(documents)
+    files = scanner.scan()
+    scan_time = perf_counter() - start
+    proposals = scanner.propose_entries(files)
+    print(f'Found {len(files)} PDF and audio files in {scanner.listed + scanner.reused} directories '
+          f'({scanner.reused} unchanged) in {scan_time:.2f} s, pairing took {perf_counter() - start - scan_time:.2f} s')
+    for code, item in proposals:
+        tags = ', '.join(item['tags'])
+        print(f'{code}: {item["name"]}\n    pdf: {item.get("pdf", "-")}\n    audio: {item.get("audio", "-")}'
+              + (f'\n    tags: {tags}' if tags else ''))
+        if add:
+            documents.update_entry(code, item)
+    print(f'{len(proposals)} new entries' + (' added' if add else ' proposed (use --add to add them)'))
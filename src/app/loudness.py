@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+from multiprocessing import Pool
+from time import perf_counter
+
+import numpy as np
+import soundfile as sf
+
+from .documents import write_json
+
+
+def k_weighting_power(sample_rate, bins):
+    """Squared magnitude response of the BS.1770 K-weighting filter (high shelf and high pass) at rfft bins"""
+    z = np.exp(-1j * np.pi * np.arange(bins) / (bins - 1))
+
+    def biquad(b, a):
+        return (b[0] + b[1] * z + b[2] * z * z) / (a[0] + a[1] * z + a[2] * z * z)
+
+    # high shelf: +4 dB above ~1.5 kHz, modelling the acoustic effect of the head
+    gain = 10 ** (4.0 / 40)
+    w0 = 2 * np.pi * 1500.0 / sample_rate
+    alpha = np.sin(w0) / (2 * (1 / np.sqrt(2)))
+    cos_w0 = np.cos(w0)
+    shelf = biquad([gain * ((gain + 1) + (gain - 1) * cos_w0 + 2 * np.sqrt(gain) * alpha),
+                    -2 * gain * ((gain - 1) + (gain + 1) * cos_w0),
+                    gain * ((gain + 1) + (gain - 1) * cos_w0 - 2 * np.sqrt(gain) * alpha)],
+                   [(gain + 1) - (gain - 1) * cos_w0 + 2 * np.sqrt(gain) * alpha,
+                    2 * ((gain - 1) - (gain + 1) * cos_w0),
+                    (gain + 1) - (gain - 1) * cos_w0 - 2 * np.sqrt(gain) * alpha])
+    # high pass at 38 Hz
+    w0 = 2 * np.pi * 38.0 / sample_rate
+    alpha = np.sin(w0) / (2 * 0.5)
+    cos_w0 = np.cos(w0)
+    high_pass = biquad([(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2],
+                       [1 + alpha, -2 * cos_w0, 1 - alpha])
+    return np.abs(shelf * high_pass) ** 2
+
+
+def analyze(path):
+    """
+    Integrated loudness (LUFS, gated as in ITU-R BS.1770) and sample peak of the audio file.
+    The file is decoded in blocks of 100 ms segments, K-weighted power of each segment is computed
+    from its spectrum, so the whole track is never held in memory.
+    """
+    with sf.SoundFile(path) as audio_file:
+        segment = audio_file.samplerate // 10
+        weights = None
+        powers = []
+        peak = 0.0
+        for block in audio_file.blocks(blocksize=segment * 256, dtype='float32', always_2d=True):
+            peak = max(peak, float(np.max(np.abs(block))) if len(block) else 0.0)
+            count = len(block) // segment
+            if count == 0:
+                continue
+            segments = block[:count * segment].reshape(count, segment, block.shape[1])
+            spectrum = np.abs(np.fft.rfft(segments, axis=1)) ** 2
+            if weights is None:
+                weights = k_weighting_power(audio_file.samplerate, spectrum.shape[1])[None, :, None]
+                # Parseval for the one-sided spectrum: inner bins stand for both halves
+                weights = weights * np.where((np.arange(spectrum.shape[1]) == 0) |
+                                             (np.arange(spectrum.shape[1]) == segment // 2), 1, 2)[None, :, None]
+            # mean square of each channel, summed over channels (weight 1.0 for front channels)
+            powers.append(np.sum(spectrum * weights, axis=(1, 2)) / (segment * segment))
+    if not powers:
+        return None, peak
+    return gated_loudness(np.concatenate(powers)), peak
+
+
+def gated_loudness(segment_powers):
+    """Integrated loudness of 400 ms blocks overlapping by 75%, built from 100 ms segment powers"""
+    if len(segment_powers) < 4:
+        return None
+    blocks = np.convolve(segment_powers, np.full(4, 0.25), mode='valid')
+    block_loudness = -0.691 + 10 * np.log10(np.maximum(blocks, 1e-20))
+    # absolute gate -70 LUFS, relative gate 10 LU below the loudness of blocks above the absolute one
+    blocks = blocks[block_loudness > -70.0]
+    if len(blocks) == 0:
+        return None
+    relative_gate = -0.691 + 10 * np.log10(np.mean(blocks)) - 10.0
+    blocks = blocks[-0.691 + 10 * np.log10(blocks) > relative_gate]
+    return float(-0.691 + 10 * np.log10(np.mean(blocks)))
+
+
+class LoudnessCache:
+    """
+    Loudness of audio files keyed by path, valid while file modification time and size don't change.
+    Playback gain brings tracks to the target loudness, limited so peaks don't clip.
+    """
+    DEF_FILE = os.getenv('HOME') + '/.music-practice/loudness.json'
+    TARGET_LUFS = -18.0
+    MAX_GAIN_DB = 12.0
+
+    def __init__(self, file_path=DEF_FILE):
+        self.__file_path = file_path
+        self.__items = None
+        self.__lock = threading.Lock()
+
+    def get(self, path):
+        """Returns (loudness, peak) of the file, None if it's not analyzed or changed since"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self.__lock:
+            item = self.__load().get(path)
+        if item and item[0] == stat.st_mtime_ns and item[1] == stat.st_size:
+            return item[2], item[3]
+        return None
+
+    def put(self, path, mtime_ns, size, loudness, peak):
+        with self.__lock:
+            self.__load()[path] = [mtime_ns, size, loudness, peak]
+
+    def save(self):
+        with self.__lock:
+            write_json(self.__file_path, self.__load())
+
+    def get_gain(self, path):
+        """Linear playback gain of the file, 1.0 if it's not analyzed"""
+        analysis = self.get(path)
+        if analysis is None or analysis[0] is None:
+            return 1.0
+        loudness, peak = analysis
+        gain_db = min(LoudnessCache.TARGET_LUFS - loudness, LoudnessCache.MAX_GAIN_DB)
+        if peak > 0:
+            gain_db = min(gain_db, -20 * np.log10(peak))
+        return float(10 ** (gain_db / 20))
+
+    def __load(self):
+        if self.__items is None:
+            try:
+                with open(self.__file_path) as input_file:
+                    self.__items = json.load(input_file)
+            except (OSError, ValueError):
+                self.__items = {}
+        return self.__items
+
+
+def analyze_library(documents, processes=None, cache=None):
+    """Analyzes loudness of audio files of all entries, skipping files analyzed before"""
+    cache = cache or LoudnessCache()
+    paths = set()
+    for code, item in documents.get_items().items():
+        if item.get('audio'):
+            path = documents.expand_path(item['audio'])
+            if cache.get(path) is None:
+                paths.add(path)
+
+    start = perf_counter()
+    analyzed = 0
+    if paths:
+        with Pool(processes) as pool:
+            for path, stat, loudness, peak, elapsed, error in pool.imap_unordered(_analyze_file, sorted(paths)):
+                if error:
+                    print(f'Failed {path}: {error}')
+                    continue
+                cache.put(path, stat[0], stat[1], loudness, peak)
+                analyzed += 1
+                loudness_text = f'{loudness:.1f} LUFS' if loudness is not None else 'silent'
+                print(f'{os.path.basename(path)}: {loudness_text}, peak {peak:.2f} in {int(elapsed * 1000)} ms')
+        cache.save()
+    print(f'Analyzed {analyzed} audio files in {perf_counter() - start:.1f} s')
+
+
+def _analyze_file(path):
+    start = perf_counter()
+    try:
+        stat = os.stat(path)
+        loudness, peak = analyze(path)
+        return path, (stat.st_mtime_ns, stat.st_size), loudness, peak, perf_counter() - start, None
+    except Exception as ex:
+        return path, None, None, None, perf_counter() - start, ex
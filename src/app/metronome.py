@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class Metronome:
+    """
+    Click track mixed into the audio output by the engine callback. Click waveforms are computed once,
+    clicks are placed at exact frame offsets of the output blocks, so their timing doesn't depend
+    on thread scheduling. Beats are counted in played frames - when the track is slowed down
+    the clicks follow its tempo.
+    """
+    CLICK_SECONDS = 0.03
+    ACCENT_FREQ = 1760.0
+    BEAT_FREQ = 1320.0
+    JITTER_ONSETS = 256
+
+    def __init__(self, sample_rate, bpm=120, beats_per_bar=4, volume=0.5):
+        self.__sample_rate = sample_rate
+        self.__accent = Metronome.__make_click(sample_rate, Metronome.ACCENT_FREQ, volume)
+        self.__beat = Metronome.__make_click(sample_rate, Metronome.BEAT_FREQ, 0.7 * volume)
+        self.__lock = threading.Lock()
+        self.__bpm = bpm
+        self.__beats_per_bar = beats_per_bar
+        self.__speed = 1.0
+        self.__interval = self.__beat_interval()
+        self.enabled = False
+        # (scheduled time, frame) of recent clicks, for get_jitter
+        self.__onsets = deque(maxlen=Metronome.JITTER_ONSETS)
+        self.reset()
+
+    @staticmethod
+    def __make_click(sample_rate, freq, volume):
+        t = np.arange(int(Metronome.CLICK_SECONDS * sample_rate)) / sample_rate
+        envelope = np.exp(-t * 150.0)
+        return (volume * envelope * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+    def reset(self):
+        """Next mixed frame becomes the first beat of a bar"""
+        with self.__lock:
+            self.__frame = 0
+            self.__next_onset = 0.0
+            self.__beat_index = 0
+            self.__sounding = None
+            self.__onsets.clear()
+
+    def set_tempo(self, bpm, beats_per_bar):
+        """New tempo is applied from the next beat"""
+        with self.__lock:
+            self.__bpm = bpm
+            self.__beats_per_bar = beats_per_bar
+            self.__interval = self.__beat_interval()
+
+    def set_speed(self, speed):
+        with self.__lock:
+            self.__speed = speed
+            self.__interval = self.__beat_interval()
+
+    def bar_frames(self):
+        return int(round(self.__beats_per_bar * self.__interval))
+
+    def mix(self, outdata, frames, dac_time=None, force=False):
+        """Adds clicks falling into the output block, dac_time is the time the block will be heard"""
+        with self.__lock:
+            start = self.__frame
+            end = start + frames
+            if self.enabled or force:
+                if self.__sounding is not None:
+                    # tail of a click started in the previous block
+                    self.__add(outdata, self.__sounding[0], self.__sounding[1], start, end)
+                while self.__next_onset < end:
+                    onset = int(round(self.__next_onset))
+                    click = self.__accent if self.__beat_index == 0 else self.__beat
+                    self.__sounding = (click, onset)
+                    self.__add(outdata, click, onset, start, end)
+                    if dac_time is not None:
+                        self.__onsets.append((dac_time + (onset - start) / self.__sample_rate, onset))
+                    self.__beat_index = (self.__beat_index + 1) % self.__beats_per_bar
+                    self.__next_onset += self.__interval
+            else:
+                # keep counting beats, so enabling the click doesn't shift the bar
+                while self.__next_onset < end:
+                    self.__beat_index = (self.__beat_index + 1) % self.__beats_per_bar
+                    self.__next_onset += self.__interval
+            self.__frame = end
+
+    def clear_onsets(self):
+        """Starts a new series of clicks for get_jitter, called when the output is interrupted (pause)"""
+        with self.__lock:
+            self.__onsets.clear()
+
+    def get_jitter(self):
+        """
+        Maximal deviation (in seconds) of click intervals from the intervals they were placed with.
+        Click times are scheduled, not measured: the DAC time of the output block reported by the audio driver
+        plus the click offset in the block, so it shows how regular the block timing of the driver is.
+        Expected intervals are taken from frame positions of the clicks, so tempo and speed changes
+        or clicks skipped while disabled don't count as jitter.
+        """
+        with self.__lock:
+            onsets = np.array(self.__onsets)
+        if len(onsets) < 2:
+            return None
+        expected = np.diff(onsets[:, 1]) / self.__sample_rate
+        return float(np.max(np.abs(np.diff(onsets[:, 0]) - expected)))
+
+    def __beat_interval(self):
+        return self.__sample_rate * 60.0 / (self.__bpm * self.__speed)
+
+    @staticmethod
+    def __add(outdata, click, onset, start, end):
+        begin = max(onset, start)
+        stop = min(onset + len(click), end)
+        if begin < stop:
+            outdata[begin - start:stop - start] += click[begin - onset:stop - onset, None]
@@ -0,0 +1,104 @@
+import bisect
+import threading
+
+
+class PageTurner:
+    """
+    Turns PDF pages following the audio, by the entry timeline: [[seconds, page], ...] (page numbered from 0,
+    the left page of the spread). A scheduler thread sleeps until the next turn is due, computed from
+    the player position and speed. The upcoming spread is requested for rendering a lead time before
+    the turn, so the turn itself is a cache hit. Seeks, loops and pauses are followed by re-reading
+    the position. get_speed returns 0 while paused. Callbacks are called on the scheduler thread.
+    """
+    LEAD_TIME = 2.0
+    # position is re-read at least this often (in seconds)
+    MAX_WAIT = 0.25
+    # position is updated per audio block, a turn expected sooner is waited for in short steps
+    MIN_WAIT = 0.002
+    # position can't move further between two reads while playing (at most MAX_WAIT at the highest speed)
+    MAX_PLAYED_STEP = 0.5
+
+    def __init__(self, timeline, start_page, get_position, get_speed, on_prerender, on_turn, lead_time=LEAD_TIME):
+        turns = sorted((float(seconds), int(page)) for seconds, page in timeline)
+        self.__times = [seconds for seconds, _ in turns]
+        self.__pages = [page for _, page in turns]
+        self.__start_page = start_page
+        self.__get_position = get_position
+        self.__get_speed = get_speed
+        self.__on_prerender = on_prerender
+        self.__on_turn = on_turn
+        self.__lead_time = lead_time
+        self.__latencies = []
+        self.__hits = 0
+        self.__terminated = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name='page-turner', daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        with self.__condition:
+            self.__terminated = True
+            self.__condition.notify()
+        if self.__thread.is_alive() and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+    def wake(self):
+        """Position was changed (e.g. seek), the next turn is scheduled again at once"""
+        with self.__condition:
+            self.__condition.notify()
+
+    def page_at(self, position):
+        index = bisect.bisect_right(self.__times, position) - 1
+        return self.__pages[index] if index >= 0 else self.__start_page
+
+    def record_turn(self, target, is_cache_hit):
+        """Called when the turned page is shown, target is the timeline time of the turn"""
+        with self.__condition:
+            self.__latencies.append((self.__get_position() - target) / max(self.__get_speed(), 0.01))
+            if is_cache_hit:
+                self.__hits += 1
+
+    def get_stats(self):
+        """Returns (turns, cache hits, mean latency, max latency) with latencies in seconds, None without turns"""
+        with self.__condition:
+            if not self.__latencies:
+                return None
+            latencies = self.__latencies
+            return len(latencies), self.__hits, sum(latencies) / len(latencies), max(latencies)
+
+    def __run(self):
+        shown = -1
+        prerendered = -1
+        last_position = 0.0
+        while True:
+            position = self.__get_position()
+            speed = self.__get_speed()
+            index = bisect.bisect_right(self.__times, position) - 1
+            if index != shown:
+                page = self.__pages[index] if index >= 0 else self.__start_page
+                # only turns reached by playing are timed, not the ones caused by seeking
+                is_played = index == shown + 1 and last_position < self.__times[index] <= position and \
+                    position - last_position <= PageTurner.MAX_PLAYED_STEP
+                self.__on_turn(page, self.__times[index] if is_played else None)
+                shown = index
+            last_position = position
+            if prerendered > index + 1:
+                # seek back, pages may have been dropped from the cache since
+                prerendered = -1
+            wait = PageTurner.MAX_WAIT
+            next_index = index + 1
+            if next_index < len(self.__times) and speed > 0:
+                # the wait is in played time, which runs faster or slower than the track when tempo is changed
+                until_turn = (self.__times[next_index] - position) / speed
+                if prerendered != next_index and until_turn <= self.__lead_time:
+                    self.__on_prerender(self.__pages[next_index])
+                    prerendered = next_index
+                until_next = until_turn if prerendered == next_index else until_turn - self.__lead_time
+                wait = min(max(until_next, PageTurner.MIN_WAIT), PageTurner.MAX_WAIT)
+            with self.__condition:
+                if not self.__terminated:
+                    self.__condition.wait(wait)
+                if self.__terminated:
+                    return
@@ -0,0 +1,25 @@
+import os
+
+
+class PathResolver:
+    """
+    Expands paths of entries starting with an alias from `paths` of the database (e.g. `SCORES/song.pdf`).
+    Only the leading path component is matched against the aliases (one dict lookup), so an alias
+    is never replaced in the middle of a path. Resolved paths are memoized, they're the same for the whole run.
+    """
+
+    def __init__(self, paths):
+        self.__roots = dict(paths)
+        self.__resolved = {}
+
+    def resolve(self, path):
+        resolved = self.__resolved.get(path)
+        if resolved is None:
+            alias, _, rest = path.partition('/')
+            root = self.__roots.get(alias)
+            if root is None:
+                resolved = path
+            else:
+                resolved = os.path.join(root, rest) if rest else root
+            self.__resolved[path] = resolved
+        return resolved
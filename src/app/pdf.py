@@ -1,17 +1,73 @@
-import fitz
+import threading
+
+from .render_cache import PrefetchWorker
+
+
+def _fitz():
+    """PyMuPDF module, it takes most of the application start-up time, so it's imported on the first use"""
+    import fitz
+    return fitz
+
 
 class PdfDocument:
     PDF_DPI = 72
     DEF_PDF_VIEW_MARGIN = 0.05
+    RENDER_RGB = 'rgb'
+    RENDER_GRAY = 'gray'
+    RENDER_MONO = 'mono'
+    RENDER_AUTO = 'auto'
+    RENDER_MODES = [RENDER_AUTO, RENDER_RGB, RENDER_GRAY, RENDER_MONO]
+    MONO_THRESHOLD = 160
+    # detection of monochrome pages is done on a small thumbnail
+    DETECT_DPI = 20
+    DETECT_COLOR_RATIO = 0.005
+    # draft pages are rendered with reduced DPI, to be zoomed by the image widget
+    DRAFT_ZOOM = 4
+    # full resolution pages are rasterized in bands of this height (pixels), PyMuPDF holds the GIL for a whole
+    # render call, so the UI thread can run between bands while the prefetch worker renders
+    BAND_HEIGHT = 256
 
-    def __init__(self, file_path):
-        self.__pdf = fitz.open(file_path)
+    def __init__(self, file_path, cache=None, render_mode=RENDER_AUTO, mono_threshold=MONO_THRESHOLD,
+                 disk_cache=None):
+        if render_mode not in PdfDocument.RENDER_MODES:
+            raise Exception(f'Unknown render mode {render_mode}')
+        self.__file_path = file_path
+        self.__render_mode = render_mode
+        self.__mono_threshold = mono_threshold
+        # maps grayscale levels to black or white
+        self.__mono_table = bytes(0 if level < mono_threshold else 255 for level in range(256))
+        self.__page_modes = {}
+        self.__pdf = _fitz().open(file_path)
         self.__page_num = 0
         self.__margin = PdfDocument.DEF_PDF_VIEW_MARGIN
+        self.__cache = cache
+        self.__disk_cache = disk_cache
+        # hash of the file content for the disk cache, computed on the first lookup
+        self.__content_hash = None
+        self.__page_boxes = {}
+        # PyMuPDF document isn't thread safe, rendering happens on the UI thread and on the prefetch worker
+        self.__lock = threading.RLock()
+        # drafts and cache lookups of the UI thread use a second handle of the document (opened on the first
+        # use), so they don't wait for a full resolution render of the prefetch worker
+        self.__ui_pdf = None
+        self.__ui_lock = threading.RLock()
+        self.__closed = False
+        self.__prefetcher = PrefetchWorker() if cache is not None else None
 
     def __len__(self):
         return self.__pdf.page_count
 
+    def close(self):
+        if self.__prefetcher:
+            self.__prefetcher.stop()
+            self.__prefetcher = None
+        with self.__lock, self.__ui_lock:
+            # a render job already taken by the worker finds the document closed, it's checked under the lock
+            self.__closed = True
+            self.__pdf.close()
+            if self.__ui_pdf is not None:
+                self.__ui_pdf.close()
+
     def current_page_num(self):
         return self.__page_num
 
@@ -30,17 +86,188 @@ class PdfDocument:
     def zoom_out(self):
         self.__margin = max(0.0, self.__margin - 0.01)
 
-    def get_pdf_page(self, view_size_px, page_offset=0):
-        if self.__page_num + page_offset not in range(self.__pdf.page_count):
+    def get_pdf_page(self, view_size_px, page_offset=0, cached_only=False):
+        """Returns rendered page, with cached_only flag returns None if the page isn't rendered yet"""
+        page_index = self.__page_num + page_offset
+        if page_index not in range(self.__pdf.page_count):
             return None
+        return self.__render_page(page_index, tuple(view_size_px), self.__margin, cached_only=cached_only)
+
+    def get_draft_page(self, view_size_px, page_offset=0):
+        """Returns quick, low resolution render of the page, DRAFT_ZOOM times smaller than the final page"""
+        page_index = self.__page_num + page_offset
+        if page_index not in range(self.__pdf.page_count):
+            return None
+        return self.__render_page(page_index, tuple(view_size_px), self.__margin, draft=True)
+
+    def refine(self, view_size_px, on_ready, step=2):
+        """
+        Renders current pages in full resolution in the background and calls on_ready when they're cached.
+        A new refine or prefetch request cancels pending renders of the previous one.
+        """
+        jobs = [self.__render_job(page_index, view_size_px) for page_index in self.__current_pages(step)]
+        jobs.append(on_ready)
+        if self.__prefetcher is None:
+            for job in jobs:
+                job()
+            return
+        self.__prefetcher.submit(jobs)
+
+    def prefetch(self, view_size_px, step=2):
+        """Render next and previous spreads in the background, so the page turn is a cache hit"""
+        if self.__prefetcher is None:
+            return
+        pages = [self.__page_num + step + n for n in range(step)] + \
+                [self.__page_num - step + n for n in range(step)]
+        self.__prefetcher.submit([self.__render_job(page_index, view_size_px)
+                                  for page_index in pages if page_index in range(self.__pdf.page_count)])
+
+    def prerender(self, page_num, view_size_px, step=2):
+        """
+        Render the spread starting at page_num in the background, ahead of a scheduled page turn.
+        Jobs are appended, so a pending refine of the shown pages still ends with its on_ready call.
+        """
+        if self.__prefetcher is None:
+            return
+        self.__prefetcher.submit([self.__render_job(page_index, view_size_px)
+                                  for page_index in range(page_num, page_num + step)
+                                  if page_index in range(self.__pdf.page_count)], append=True)
+
+    def __current_pages(self, step):
+        return [page_index for page_index in range(self.__page_num, self.__page_num + step)
+                if page_index in range(self.__pdf.page_count)]
 
-        page = self.__pdf[self.__page_num + page_offset]
-        box = page.mediabox
-        pdf_x, pdf_y = box[2:4]
-        margin = self.__margin * pdf_x
+    def __render_job(self, page_index, view_size_px):
+        margin = self.__margin
+        return lambda: self.__render_page(page_index, tuple(view_size_px), margin)
+
+    @staticmethod
+    def resample(pixmap, scale):
+        """
+        Returns pixmap scaled by the given factor. The cost grows with the pixel count, for a full resolution page
+        it's close to rendering the page again (15-50 ms), for a draft page it's about 1 ms.
+        """
+        fitz = _fitz()
+        return fitz.Pixmap(pixmap, max(1, int(pixmap.width * scale)), max(1, int(pixmap.height * scale)), None)
+
+    @staticmethod
+    def to_image_data(pixmap):
+        """
+        Returns pixmap as uncompressed PPM (RGB) or PGM (grayscale) data, which image widgets read directly.
+        It avoids PNG compression of the whole page just to have it decompressed by the widget again.
+        """
+        magic = b'P5' if pixmap.n == 1 else b'P6'
+        header = b'%s\n%d %d\n255\n' % (magic, pixmap.width, pixmap.height)
+        return b''.join((header, pixmap.samples_mv))
+
+    def __page_box(self, pdf, page_index):
+        box = self.__page_boxes.get(page_index)
+        if box is None:
+            box = tuple(pdf[page_index].mediabox[2:4])
+            self.__page_boxes[page_index] = box
+        return box
+
+    def __page_mode(self, pdf, page_index):
+        if self.__render_mode != PdfDocument.RENDER_AUTO:
+            return self.__render_mode
+        mode = self.__page_modes.get(page_index)
+        if mode is None:
+            thumbnail = pdf[page_index].get_pixmap(dpi=PdfDocument.DETECT_DPI, alpha=False)
+            samples = thumbnail.samples
+            red, green, blue = samples[0::3], samples[1::3], samples[2::3]
+            if red == green == blue:
+                mode = PdfDocument.RENDER_GRAY
+            else:
+                # scanned pages may have slight color noise, compare quantized channels
+                color_pixels = sum(map(lambda r, g, b: r >> 4 != g >> 4 or g >> 4 != b >> 4, red, green, blue))
+                is_mono = color_pixels <= PdfDocument.DETECT_COLOR_RATIO * len(red)
+                mode = PdfDocument.RENDER_GRAY if is_mono else PdfDocument.RENDER_RGB
+            self.__page_modes[page_index] = mode
+        return mode
+
+    def __render_page(self, page_index, view_size_px, margin_ratio, cached_only=False, draft=False):
+        content_hash = None
+        if self.__disk_cache is not None and not draft:
+            if self.__content_hash is None:
+                # memoized by the disk cache with the file modification time and size
+                self.__content_hash = self.__disk_cache.file_hash(self.__file_path)
+            content_hash = self.__content_hash
+        if draft or cached_only:
+            with self.__ui_lock:
+                if self.__closed:
+                    return None
+                if self.__ui_pdf is None:
+                    self.__ui_pdf = _fitz().open(self.__file_path)
+                png, disk_key = self.__render_with(self.__ui_pdf, page_index, view_size_px, margin_ratio,
+                                                   cached_only, draft, content_hash)
+        else:
+            with self.__lock:
+                if self.__closed:
+                    return None
+                png, disk_key = self.__render_with(self.__pdf, page_index, view_size_px, margin_ratio,
+                                                   cached_only, draft, content_hash)
+        if disk_key is not None:
+            # written after the document is unlocked, so other renders don't wait for the disk
+            self.__disk_cache.put(disk_key, png)
+        return png
+
+    @staticmethod
+    def __render_bands(page, dpi, clip, colorspace):
+        """Renders the page like page.get_pixmap, band by band from its display list"""
+        fitz = _fitz()
+        matrix = fitz.Matrix(dpi / PdfDocument.PDF_DPI, dpi / PdfDocument.PDF_DPI)
+        area = (fitz.Rect(clip) * matrix).round()
+        display_list = page.get_displaylist()
+        pixmap = fitz.Pixmap(colorspace, area, False)
+        for top in range(area.y0, area.y1, PdfDocument.BAND_HEIGHT):
+            band = fitz.IRect(area.x0, top, area.x1, min(top + PdfDocument.BAND_HEIGHT, area.y1))
+            # rendered with a pixel of overlap, so anti-aliasing at band edges is the same as inside the band
+            band_clip = fitz.Rect(band.x0, band.y0 - 1, band.x1, band.y1 + 1) * ~matrix
+            pixmap.copy(display_list.get_pixmap(matrix=matrix, colorspace=colorspace, alpha=False, clip=band_clip),
+                        band)
+        return pixmap
+
+    def __render_with(self, pdf, page_index, view_size_px, margin_ratio, cached_only, draft, content_hash):
+        """
+        Renders the page with the document handle, which is locked by the caller.
+        Returns (page, disk cache key), the key is set if the page is new and should be written to the disk cache.
+        """
+        fitz = _fitz()
+        pdf_x, pdf_y = self.__page_box(pdf, page_index)
+        margin = margin_ratio * pdf_x
         clip = (margin, margin, pdf_x - margin, pdf_y - margin)
         pdf_view_height = pdf_y - 2 * margin
 
         img_x, img_y = view_size_px
-        png = page.get_pixmap(dpi=int(PdfDocument.PDF_DPI * img_y / pdf_view_height), alpha=False, clip=clip)
-        return png
+        dpi = int(PdfDocument.PDF_DPI * img_y / pdf_view_height)
+        mode = self.__page_mode(pdf, page_index)
+        key = (self.__file_path, page_index, view_size_px, margin_ratio, dpi, mode, self.__mono_threshold)
+        disk_key = (content_hash, page_index, view_size_px, margin_ratio, mode, self.__mono_threshold)
+        if self.__cache is not None and not draft:
+            png = self.__cache.get(key)
+            if png is not None:
+                return png, None
+        if self.__disk_cache is not None and not draft:
+            png = self.__disk_cache.get(disk_key)
+            if png is not None:
+                if self.__cache is not None:
+                    self.__cache.put(key, png)
+                return png, None
+        if cached_only and self.__cache is not None:
+            return None, None
+
+        page = pdf[page_index]
+        colorspace = fitz.csRGB if mode == PdfDocument.RENDER_RGB else fitz.csGRAY
+        render_dpi = max(1, dpi // PdfDocument.DRAFT_ZOOM) if draft else dpi
+        if draft:
+            png = page.get_pixmap(dpi=render_dpi, alpha=False, clip=clip, colorspace=colorspace)
+        else:
+            png = PdfDocument.__render_bands(page, render_dpi, clip, colorspace)
+        if mode == PdfDocument.RENDER_MONO:
+            png = fitz.Pixmap(fitz.csGRAY, png.width, png.height,
+                              png.samples_mv.tobytes().translate(self.__mono_table), False)
+        if draft:
+            return png, None
+        if self.__cache is not None:
+            self.__cache.put(key, png)
+        return png, disk_key if self.__disk_cache is not None else None
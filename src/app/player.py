@@ -1,42 +1,160 @@
-import pygame.mixer as mixer
 import math
+import threading
+
+from .audio_probe import probe_duration
+
+
+class PreloadedTrack:
+    """Track opened on its own engine with the beginning buffered, ready to replace the playing one"""
+
+    def __init__(self, engine, length):
+        self.engine = engine
+        self.length = length
+
+    def close(self):
+        self.engine.close()
 
 
 class Player:
     """
-    Simple facade for pygame mixer, defining functionality for playing an audio file
+    Simple facade for the streaming audio engine, defining functionality for playing an audio file.
+    The engine (numpy, soundfile and PortAudio) is loaded with the first played track, not at start-up,
+    until then the player reports an idle state.
     """
 
     def __init__(self):
         self.__len = None
         self.__is_paused = False
-        mixer.init()
+        self.__engine = None
+        self.__loudness = None
+        self.__click = None
+        self.__lock = threading.Lock()
 
     def play(self, path):
-        sound = mixer.Sound(path)
-        self.__len = sound.get_length()
-        mixer.music.load(path)
-        mixer.music.play()
+        self.load(path)
+        self.start()
+
+    def load(self, path, semitones=0, speed=1.0):
+        # duration is read from file headers, the track itself is streamed by the engine
+        self.__len = probe_duration(path)
+        self.__is_paused = False
+        engine = self.__get_engine()
+        # tracks analyzed with --analyze-loudness are played at the same loudness
+        engine.set_gain(self.__get_loudness().get_gain(path))
+        engine.load(path, semitones, speed)
+        if self.__len is None:
+            self.__len = engine.get_duration()
+
+    def start(self, count_in_bars=0):
+        self.__get_engine().start(count_in_bars)
+
+    def preload(self, path, semitones=0, speed=1.0):
+        """Opens the track on its own engine (may be called on a worker thread), started with start_preloaded"""
+        from .audio_engine import StreamEngine
+        engine = StreamEngine()
+        engine.set_gain(self.__get_loudness().get_gain(path))
+        engine.load(path, semitones, speed)
+        length = probe_duration(path)
+        return PreloadedTrack(engine, length if length is not None else engine.get_duration())
+
+    def start_preloaded(self, track, count_in_bars=0):
+        """Stops the playing track and starts the preloaded one from its buffered data"""
+        if self.__engine is not None:
+            self.__engine.close()
+        self.__engine = track.engine
+        if self.__click is not None:
+            self.__engine.set_click(*self.__click)
+        self.__len = track.length
+        self.__is_paused = False
+        self.__engine.start(count_in_bars)
 
     def stop(self):
-        mixer.music.stop()
+        if self.__engine is not None:
+            self.__engine.close()
         self.__len = None
+        self.__is_paused = False
 
     def pause(self):
-        if mixer.music.get_busy():
-            mixer.music.pause()
-            self.__is_paused = True
-        elif mixer.music.get_pos() > 0:
-            mixer.music.unpause()
-            self.__is_paused = False
+        if self.__engine is None or not self.__engine.is_streaming():
+            return
+        self.__is_paused = not self.__is_paused
+        self.__engine.set_paused(self.__is_paused)
+
+    def seek(self, seconds):
+        if self.__engine is not None:
+            self.__engine.seek(seconds)
+
+    def set_transpose(self, semitones):
+        if self.__engine is not None:
+            self.__engine.set_transpose(semitones)
+
+    def get_transpose(self):
+        return self.__engine.get_transpose() if self.__engine is not None else 0
+
+    def set_speed(self, speed):
+        if self.__engine is not None:
+            self.__engine.set_speed(speed)
+
+    def get_speed(self):
+        return self.__engine.get_speed() if self.__engine is not None else 1.0
+
+    def set_click(self, enabled, bpm, beats_per_bar):
+        self.__click = (enabled, bpm, beats_per_bar)
+        if self.__engine is not None:
+            self.__engine.set_click(enabled, bpm, beats_per_bar)
+
+    def get_click_jitter(self):
+        return self.__engine.get_click_jitter() if self.__engine is not None else None
+
+    def set_loop(self, start, end):
+        if self.__engine is not None:
+            self.__engine.set_loop(start, end)
+
+    def clear_loop(self):
+        if self.__engine is not None:
+            self.__engine.clear_loop()
+
+    def get_loop(self):
+        return self.__engine.get_loop() if self.__engine is not None else None
+
+    def is_finished(self):
+        return self.__engine is not None and self.__engine.is_finished()
 
     def get_pos(self):
-        return mixer.music.get_pos() // 1000
+        return math.trunc(self.get_position())
+
+    def get_position(self):
+        """Position in seconds (not truncated)"""
+        return self.__engine.get_position() if self.__engine is not None else 0.0
+
+    def get_pos_ms(self):
+        return math.trunc(self.get_position() * 1000)
 
     def get_len(self):
         if self.__len:
             return math.trunc(self.__len)
         return 0
 
+    def get_len_ms(self):
+        if self.__len:
+            return math.trunc(self.__len * 1000)
+        return 0
+
     def is_paused(self):
-        return self.__is_paused
\ No newline at end of file
+        return self.__is_paused
+
+    def __get_engine(self):
+        with self.__lock:
+            if self.__engine is None:
+                from .audio_engine import StreamEngine
+                self.__engine = StreamEngine()
+                if self.__click is not None:
+                    self.__engine.set_click(*self.__click)
+            return self.__engine
+
+    def __get_loudness(self):
+        with self.__lock:
+            if self.__loudness is None:
+                from .loudness import LoudnessCache
+                self.__loudness = LoudnessCache()
+            return self.__loudness
@@ -0,0 +1,137 @@
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+
+class PreparePipeline:
+    """
+    Prepares a document entry before playback. PDF and audio tasks run concurrently on worker threads,
+    while the lead-in countdown is reported to the window. Playback is started from the pipeline thread
+    as soon as the lead-in ends and all tasks are finished.
+    Results are delivered to the UI loop with window events.
+    The audio task result (e.g. a track opened on its own engine) is handed to on_start, or closed
+    if the pipeline is cancelled or fails, so nothing of a cancelled preparation reaches the player.
+    """
+    EVENT_PDF_READY = 'PREPARE_PDF_READY'
+    EVENT_COUNTDOWN = 'PREPARE_COUNTDOWN'
+    EVENT_DONE = 'PREPARE_DONE'
+    EVENT_ERROR = 'PREPARE_ERROR'
+
+    def __init__(self, window, lead_in):
+        self.__window = window
+        self.__lead_in = lead_in
+        self.__cancelled = threading.Event()
+        self.__timings = {}
+        self.__timings_lock = threading.Lock()
+        # set once the PDF result is posted (or dropped), EVENT_DONE must not overtake EVENT_PDF_READY
+        self.__pdf_handled = threading.Event()
+        # cancellation, hand-over and closing of the audio result are done under the lock
+        self.__lock = threading.Lock()
+        self.__audio_result = None
+        self.__audio_handled = threading.Event()
+        self.__executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='prepare')
+
+    def start(self, pdf_task=None, audio_task=None, on_start=None):
+        """
+        Runs tasks and starts countdown. PDF task result is sent with EVENT_PDF_READY as soon as it's ready,
+        on_start callback is executed with the audio task result when lead-in ends (only if there is an audio task).
+        """
+        deadline = monotonic() + (self.__lead_in if audio_task else 0)
+        pdf_future = None
+        if pdf_task:
+            pdf_future = self.__executor.submit(pdf_task, self)
+            pdf_future.add_done_callback(self.__pdf_done)
+        audio_future = None
+        if audio_task:
+            audio_future = self.__executor.submit(audio_task, self)
+            audio_future.add_done_callback(self.__audio_done)
+        self.__executor.shutdown(wait=False)
+        threading.Thread(target=self.__countdown, args=(deadline, pdf_future, audio_future, on_start),
+                         name='prepare-countdown', daemon=True).start()
+
+    def cancel(self):
+        with self.__lock:
+            self.__cancelled.set()
+            result, self.__audio_result = self.__audio_result, None
+        PreparePipeline.__close(result)
+
+    def is_cancelled(self):
+        return self.__cancelled.is_set()
+
+    def step(self, name, fn, *args, **kwargs):
+        """Executes single preparation step and records its duration"""
+        start = monotonic()
+        result = fn(*args, **kwargs)
+        with self.__timings_lock:
+            self.__timings[name] = monotonic() - start
+        return result
+
+    def __pdf_done(self, future):
+        try:
+            if future.exception() is not None:
+                return
+            if self.__cancelled.is_set():
+                future.result().close()
+                return
+            self.__post(PreparePipeline.EVENT_PDF_READY, future.result())
+        finally:
+            self.__pdf_handled.set()
+
+    def __audio_done(self, future):
+        try:
+            if future.exception() is not None:
+                return
+            with self.__lock:
+                if not self.__cancelled.is_set():
+                    self.__audio_result = future.result()
+                    return
+            PreparePipeline.__close(future.result())
+        finally:
+            self.__audio_handled.set()
+
+    @staticmethod
+    def __close(result):
+        if result is not None:
+            result.close()
+
+    def __countdown(self, deadline, pdf_future, audio_future, on_start):
+        remaining = math.ceil(deadline - monotonic())
+        while remaining > 0:
+            self.__post(PreparePipeline.EVENT_COUNTDOWN, remaining)
+            remaining -= 1
+            if self.__cancelled.wait(max(0.0, deadline - remaining - monotonic())):
+                return
+        try:
+            for future in (pdf_future, audio_future):
+                if future is not None:
+                    future.result()
+        except Exception as ex:
+            self.__post(PreparePipeline.EVENT_ERROR, ex)
+            self.cancel()
+            return
+        # result() returns before done callbacks of the future are called
+        if pdf_future is not None:
+            self.__pdf_handled.wait()
+        if audio_future is not None:
+            self.__audio_handled.wait()
+        if audio_future is not None and on_start is not None:
+            with self.__timings_lock:
+                self.__timings['lead-in overrun'] = max(0.0, monotonic() - deadline)
+            # the pipeline can't be cancelled while the track is handed over to the player
+            with self.__lock:
+                if self.__cancelled.is_set():
+                    return
+                result, self.__audio_result = self.__audio_result, None
+                try:
+                    on_start(result)
+                except Exception as ex:
+                    self.__post(PreparePipeline.EVENT_ERROR, ex)
+                    return
+        if self.__cancelled.is_set():
+            return
+        self.__post(PreparePipeline.EVENT_DONE, dict(self.__timings))
+
+    def __post(self, event, value):
+        if not self.__cancelled.is_set():
+            self.__window.write_event_value(event, (self, value))
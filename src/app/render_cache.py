@@ -0,0 +1,105 @@
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    In-memory LRU cache of rendered PDF pages (pixmaps), limited by the total size of pixel data.
+    Entries are keyed by (file, page, view size, margin, DPI) tuples built by PdfDocument.
+    The cache is shared between the UI thread and the prefetch worker, so all operations are locked.
+    """
+    DEF_MAX_BYTES = 256 * 1024 * 1024
+
+    def __init__(self, max_bytes=DEF_MAX_BYTES):
+        self.__max_bytes = max_bytes
+        self.__items = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__items)
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__items
+
+    def get(self, key):
+        with self.__lock:
+            item = self.__items.get(key)
+            if item is None:
+                return None
+            self.__items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, pixmap):
+        item_size = len(pixmap.samples_mv)
+        if item_size > self.__max_bytes:
+            return
+        with self.__lock:
+            old = self.__items.pop(key, None)
+            if old is not None:
+                self.__size -= old[1]
+            self.__items[key] = (pixmap, item_size)
+            self.__size += item_size
+            while self.__size > self.__max_bytes:
+                _, (_, evicted_size) = self.__items.popitem(last=False)
+                self.__size -= evicted_size
+
+    def clear(self):
+        with self.__lock:
+            self.__items.clear()
+            self.__size = 0
+
+
+class PrefetchWorker:
+    """
+    Background thread rendering pages into the cache ahead of time.
+    Only the most recent request is kept - submitting new jobs replaces the pending ones,
+    so fast page turning or zooming doesn't build up a backlog of outdated renders.
+    Jobs submitted with append=True are added to the current request instead of replacing it.
+    """
+
+    def __init__(self, name='pdf-prefetch'):
+        self.__pending = None
+        # set when a new request replaces the one being run
+        self.__replaced = False
+        self.__terminated = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__thread.start()
+
+    def submit(self, jobs, append=False):
+        with self.__condition:
+            if append:
+                self.__pending = (self.__pending or []) + list(jobs)
+            else:
+                self.__pending = list(jobs)
+                self.__replaced = True
+            self.__condition.notify()
+
+    def stop(self):
+        with self.__condition:
+            self.__terminated = True
+            self.__pending = None
+            self.__condition.notify()
+
+    def __run(self):
+        while True:
+            with self.__condition:
+                self.__condition.wait_for(lambda: self.__terminated or self.__pending)
+                if self.__terminated:
+                    return
+                jobs, self.__pending = self.__pending, None
+                self.__replaced = False
+            for job in jobs:
+                with self.__condition:
+                    # newer request arrived - drop the rest of the outdated one
+                    if self.__terminated or self.__replaced:
+                        break
+                try:
+                    job()
+                except Exception:
+                    # jobs only prepare optional results (cached pages, waveform, next entry),
+                    # a page which failed to render is rendered again when shown, and reports the error then
+                    pass
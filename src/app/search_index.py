@@ -0,0 +1,233 @@
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+from time import perf_counter
+
+from .documents import write_json
+from .pdf import _fitz
+
+
+class SearchHit:
+    """Page of an entry PDF matching the search query"""
+
+    def __init__(self, code, name, page_num):
+        self.code = code
+        self.name = name
+        self.page_num = page_num
+
+    def __str__(self):
+        return f'{self.name} (page {self.page_num + 1})'
+
+
+class SearchIndex:
+    """
+    Full-text index of PDF pages: term -> pages of documents containing it.
+    Each document is stored in its own file named by the content hash, so moved or duplicated PDFs
+    are indexed once. Files are checked by modification time and size, only new or changed ones are hashed
+    and indexed again. The whole index is loaded into memory for queries.
+    """
+    DEF_DIR = os.getenv('HOME') + '/.music-practice/search'
+    FILES = 'files.json'
+    MIN_TERM = 2
+    MAX_PREFIX_TERMS = 100
+
+    def __init__(self, directory=DEF_DIR):
+        self.__directory = directory
+        self.__lock = threading.Lock()
+        self.__files = None
+        self.__postings = None
+        self.__sorted_terms = None
+
+    @staticmethod
+    def terms(text):
+        return [term for term in re.findall(r'\w+', text.lower()) if len(term) >= SearchIndex.MIN_TERM]
+
+    def load(self):
+        """Loads the index into memory (may be called on a background thread)"""
+        with self.__lock:
+            self.__load()
+
+    def get_files(self):
+        with self.__lock:
+            return dict(self.__read_files())
+
+    def search(self, query):
+        """Returns (path, page) pairs with pages containing all words, the last word may be a prefix"""
+        words = SearchIndex.terms(query)
+        if not words:
+            return []
+        with self.__lock:
+            self.__load()
+            pages = None
+            for position, word in enumerate(words):
+                if position == len(words) - 1:
+                    word_pages = set()
+                    for term in self.__prefix_terms(word):
+                        word_pages.update(self.__postings[term])
+                else:
+                    word_pages = set(self.__postings.get(word, ()))
+                pages = word_pages if pages is None else pages & word_pages
+                if not pages:
+                    return []
+            paths = {}
+            for path, (_, _, content_hash) in self.__files.items():
+                paths.setdefault(content_hash, []).append(path)
+        return sorted((path, page) for content_hash, page in pages for path in paths.get(content_hash, ()))
+
+    def search_entries(self, documents, query, limit=100):
+        """Search hits mapped to entries, a page is assigned to the entry starting closest before it"""
+        entries_by_path = {}
+        for code, item in documents.get_items().items():
+            if item.get('pdf'):
+                path = os.path.normpath(documents.expand_path(item['pdf']))
+                entries_by_path.setdefault(path, []).append((item.get('page_num', 0), code, item['name']))
+        hits = []
+        for path, page in self.search(query):
+            entries = entries_by_path.get(path)
+            if not entries:
+                continue
+            starting_before = [entry for entry in entries if entry[0] <= page]
+            _, code, name = max(starting_before) if starting_before else min(entries)
+            hits.append(SearchHit(code, name, page))
+            if len(hits) >= limit:
+                break
+        return hits
+
+    def update(self, path, stat, content_hash, page_count, postings):
+        """Stores postings of a document (None if the content is indexed already)"""
+        with self.__lock:
+            files = self.__read_files()
+            if postings is not None:
+                self.__write_json(content_hash + '.json', {'pages': page_count, 'terms': postings})
+            files[path] = [stat[0], stat[1], content_hash]
+            self.__postings = None
+
+    def remove_missing(self, paths):
+        """Drops files not in paths, along with documents no longer used by any file"""
+        with self.__lock:
+            files = self.__read_files()
+            for path in set(files) - set(paths):
+                del files[path]
+            used = set(item[2] for item in files.values())
+            if os.path.isdir(self.__directory):
+                for name in os.listdir(self.__directory):
+                    if name.endswith('.json') and name != SearchIndex.FILES and name[:-5] not in used:
+                        os.remove(os.path.join(self.__directory, name))
+            self.__postings = None
+
+    def save(self):
+        with self.__lock:
+            self.__write_json(SearchIndex.FILES, self.__read_files())
+
+    def get_directory(self):
+        return self.__directory
+
+    def is_indexed(self, content_hash):
+        return os.path.exists(os.path.join(self.__directory, content_hash + '.json'))
+
+    def __read_files(self):
+        if self.__files is None:
+            self.__files = self.__read_json(SearchIndex.FILES, {})
+        return self.__files
+
+    def __load(self):
+        if self.__postings is not None:
+            return
+        postings = {}
+        for content_hash in set(item[2] for item in self.__read_files().values()):
+            document = self.__read_json(content_hash + '.json', None)
+            if document is None:
+                continue
+            for term, pages in document['terms'].items():
+                postings.setdefault(term, []).extend((content_hash, page) for page in pages)
+        self.__postings = postings
+        self.__sorted_terms = sorted(postings)
+
+    def __prefix_terms(self, prefix):
+        start = bisect.bisect_left(self.__sorted_terms, prefix)
+        terms = []
+        for term in self.__sorted_terms[start:start + SearchIndex.MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def __read_json(self, name, default):
+        try:
+            with open(os.path.join(self.__directory, name)) as input_file:
+                return json.load(input_file)
+        except (OSError, ValueError):
+            return default
+
+    def __write_json(self, name, value):
+        write_json(os.path.join(self.__directory, name), value)
+
+
+def build_search_index(documents, processes=None, index=None):
+    """Indexes text of PDF files of all entries, only new or changed files are processed"""
+    # the module is imported by the application too, the pool is needed only here
+    from multiprocessing import Pool
+    index = index or SearchIndex()
+    files = index.get_files()
+    paths = set()
+    jobs = []
+    for item in documents.get_items().values():
+        if not item.get('pdf'):
+            continue
+        path = os.path.normpath(documents.expand_path(item['pdf']))
+        if path in paths:
+            continue
+        paths.add(path)
+        try:
+            stat = os.stat(path)
+        except OSError as ex:
+            print(f'Failed {path}: {ex}')
+            continue
+        known = files.get(path)
+        if known is None or known[0] != stat.st_mtime_ns or known[1] != stat.st_size:
+            jobs.append(path)
+
+    start = perf_counter()
+    indexed = 0
+    if jobs:
+        with Pool(processes) as pool:
+            for path, stat, content_hash, page_count, postings, elapsed, error in \
+                    pool.imap_unordered(_index_pdf, [(path, index.get_directory()) for path in jobs]):
+                if error:
+                    print(f'Failed {path}: {error}')
+                    continue
+                index.update(path, stat, content_hash, page_count, postings)
+                indexed += 1
+                print(f'{os.path.basename(path)}: {page_count} pages in {int(elapsed * 1000)} ms')
+    index.remove_missing(paths)
+    index.save()
+    print(f'Indexed {indexed} of {len(paths)} PDF files in {perf_counter() - start:.1f} s')
+
+
+def _index_pdf(job):
+    fitz = _fitz()
+    path, directory = job
+    index = SearchIndex(directory)
+    start = perf_counter()
+    try:
+        stat = os.stat(path)
+        digest = hashlib.sha1()
+        with open(path, 'rb') as input_file:
+            for chunk in iter(lambda: input_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+        if index.is_indexed(content_hash):
+            # same content indexed under another path
+            return path, (stat.st_mtime_ns, stat.st_size), content_hash, None, None, perf_counter() - start, None
+        postings = {}
+        with fitz.open(path) as pdf:
+            page_count = pdf.page_count
+            for page_num, page in enumerate(pdf):
+                for term in set(SearchIndex.terms(page.get_text())):
+                    postings.setdefault(term, []).append(page_num)
+        return path, (stat.st_mtime_ns, stat.st_size), content_hash, page_count, postings, perf_counter() - start, None
+    except Exception as ex:
+        return path, None, None, None, None, perf_counter() - start, ex
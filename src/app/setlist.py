@@ -0,0 +1,118 @@
+import threading
+
+
+class Setlist:
+    """Queue of entries (DocumentEntry) played one after another"""
+
+    def __init__(self):
+        self.entries = []
+        self.__index = None
+
+    def add(self, entry):
+        self.entries.append(entry)
+
+    def remove(self, index):
+        del self.entries[index]
+        if self.__index is not None and index <= self.__index:
+            # removing the playing entry continues with the one following it
+            self.__index -= 1
+
+    def clear(self):
+        self.entries = []
+        self.__index = None
+
+    def start(self):
+        """Returns the first entry, None if the setlist is empty"""
+        self.__index = 0 if self.entries else None
+        return self.current()
+
+    def stop(self):
+        self.__index = None
+
+    def is_active(self):
+        return self.__index is not None
+
+    def current(self):
+        if self.__index is None or not 0 <= self.__index < len(self.entries):
+            return None
+        return self.entries[self.__index]
+
+    def get_index(self):
+        return self.__index
+
+    def peek_next(self):
+        if self.__index is None or self.__index + 1 >= len(self.entries):
+            return None
+        return self.entries[self.__index + 1]
+
+    def advance(self):
+        """Moves to the next entry and returns it, at the end of the setlist stops and returns None"""
+        if self.__index is None:
+            return None
+        self.__index += 1
+        entry = self.current()
+        if entry is None:
+            self.__index = None
+        return entry
+
+
+class PreloadedEntry:
+    """
+    Next entry of the setlist opened in the background: the PDF with its first spread rendered into the cache
+    and the audio track with its beginning buffered. Only one entry is preloaded at a time, so only the playing
+    and the next entry are kept open. Results of a cancelled preload are closed, also when they arrive later.
+    """
+
+    def __init__(self, code, document):
+        self.code = code
+        self.document = document
+        self.pdf = None
+        self.track = None
+        self.audio_path = None
+        self.error = None
+        self.__cancelled = False
+        self.__ready = threading.Event()
+        self.__lock = threading.Lock()
+
+    def set_pdf(self, pdf):
+        with self.__lock:
+            if not self.__cancelled:
+                self.pdf = pdf
+                return
+        pdf.close()
+
+    def set_track(self, track):
+        with self.__lock:
+            if not self.__cancelled:
+                self.track = track
+                return
+        track.close()
+
+    def set_ready(self, error=None):
+        self.error = error
+        self.__ready.set()
+
+    def is_ready(self):
+        return self.__ready.is_set() and self.error is None
+
+    def take(self):
+        """Hands the PDF and the track over to playback, they aren't closed by cancel anymore"""
+        with self.__lock:
+            self.__cancelled = True
+            pdf, self.pdf = self.pdf, None
+            track, self.track = self.track, None
+        return pdf, track
+
+    def is_cancelled(self):
+        return self.__cancelled
+
+    def cancel(self):
+        """Closes the preloaded PDF and track"""
+        with self.__lock:
+            self.__cancelled = True
+            pdf, self.pdf = self.pdf, None
+            track, self.track = self.track, None
+        if pdf is not None:
+            pdf.close()
+        if track is not None:
+            track.close()
@@ -0,0 +1,148 @@
+import json
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    """
+    Database kept in SQLite file. Each item is a single row (with tags in a separate table),
+    so updating an entry is a single small transaction instead of rewriting the whole database.
+    Item fields without dedicated columns are kept as json in the 'extra' column.
+    Tags of an item are unique, repeated tags are stored once (at the position of the first one).
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS paths (alias TEXT PRIMARY KEY, path TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS items (
+            code TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            pdf TEXT,
+            audio TEXT,
+            page_num INTEGER,
+            extra TEXT
+        );
+        CREATE TABLE IF NOT EXISTS tags (
+            code TEXT NOT NULL REFERENCES items(code) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (code, tag)
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_name ON items(name);
+        CREATE INDEX IF NOT EXISTS idx_items_pdf ON items(pdf);
+        CREATE INDEX IF NOT EXISTS idx_items_audio ON items(audio);
+        CREATE INDEX IF NOT EXISTS idx_tags_tag ON tags(tag);
+    """
+    COLUMNS = ('name', 'pdf', 'audio', 'page_num')
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.__connection = sqlite3.connect(file_path, check_same_thread=False)
+        self.__connection.execute('PRAGMA foreign_keys = ON')
+        self.__connection.execute('PRAGMA journal_mode = WAL')
+        self.__connection.executescript(SqliteStore.SCHEMA)
+        self.__lock = threading.Lock()
+        self.__paths = {}
+        self.__settings = {}
+
+    def load(self):
+        with self.__lock:
+            self.__paths = dict(self.__connection.execute('SELECT alias, path FROM paths'))
+            row = self.__connection.execute("SELECT value FROM meta WHERE key = 'settings'").fetchone()
+            self.__settings = json.loads(row[0]) if row else {}
+
+    def get_paths(self):
+        return self.__paths
+
+    def get_settings(self):
+        return self.__settings
+
+    def get_summaries(self):
+        """Yields (code, name, is_audio, is_pdf, tags, page_num) of all items, without reading other fields"""
+        with self.__lock:
+            rows = self.__connection.execute("""
+                SELECT i.code, i.name, i.audio IS NOT NULL, i.pdf IS NOT NULL, i.page_num,
+                       (SELECT json_group_array(tag) FROM (SELECT tag FROM tags t WHERE t.code = i.code
+                                                           ORDER BY position))
+                FROM items i
+            """).fetchall()
+        for code, name, is_audio, is_pdf, page_num, tags in rows:
+            yield code, name, bool(is_audio), bool(is_pdf), json.loads(tags), page_num
+
+    def get_item(self, key):
+        with self.__lock:
+            row = self.__connection.execute('SELECT code, name, pdf, audio, page_num, extra FROM items WHERE code = ?',
+                                            (key,)).fetchone()
+            if row is None:
+                return None
+            tags = [tag for tag, in self.__connection.execute(
+                'SELECT tag FROM tags WHERE code = ? ORDER BY position', (key,))]
+        return SqliteStore.__row_to_item(row, tags)
+
+    def get_items(self):
+        with self.__lock:
+            rows = self.__connection.execute('SELECT code, name, pdf, audio, page_num, extra FROM items').fetchall()
+            tags = {}
+            for code, tag in self.__connection.execute('SELECT code, tag FROM tags ORDER BY code, position'):
+                tags.setdefault(code, []).append(tag)
+        return {row[0]: SqliteStore.__row_to_item(row, tags.get(row[0], [])) for row in rows}
+
+    def put_item(self, key, value):
+        with self.__lock, self.__connection:
+            self.__put_item(key, value)
+
+    def import_json(self, documents):
+        with self.__lock, self.__connection:
+            self.__connection.execute('DELETE FROM tags')
+            self.__connection.execute('DELETE FROM items')
+            self.__connection.execute('DELETE FROM paths')
+            self.__connection.execute('DELETE FROM meta')
+            self.__connection.executemany('INSERT INTO paths (alias, path) VALUES (?, ?)',
+                                          documents.get('paths', {}).items())
+            self.__connection.executemany('INSERT INTO meta (key, value) VALUES (?, ?)',
+                                          [(key, json.dumps(value)) for key, value in documents.items()
+                                           if key not in ('paths', 'items')])
+            for key, value in documents.get('items', {}).items():
+                self.__put_item(key, value)
+
+    def to_json(self):
+        with self.__lock:
+            meta = {key: json.loads(value) for key, value in self.__connection.execute('SELECT key, value FROM meta')}
+        documents = {'paths': dict(self.__paths), 'items': self.get_items()}
+        documents.update(meta)
+        return documents
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+    def __put_item(self, key, value):
+        extra = {field: field_value for field, field_value in value.items()
+                 if field not in SqliteStore.COLUMNS and field != 'tags'}
+        if 'tags' in value and not value['tags']:
+            # empty list has no rows in tags table, it's kept in extra, so the item is exported unchanged
+            extra['tags'] = []
+        self.__connection.execute("""
+            INSERT INTO items (code, name, pdf, audio, page_num, extra) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (code) DO UPDATE SET name = excluded.name, pdf = excluded.pdf, audio = excluded.audio,
+                                             page_num = excluded.page_num, extra = excluded.extra
+        """, (key, value['name'], value.get('pdf'), value.get('audio'), value.get('page_num'),
+              json.dumps(extra) if extra else None))
+        self.__connection.execute('DELETE FROM tags WHERE code = ?', (key,))
+        self.__connection.executemany('INSERT OR IGNORE INTO tags (code, tag, position) VALUES (?, ?, ?)',
+                                      [(key, tag, position) for position, tag in enumerate(value.get('tags', []))])
+
+    @staticmethod
+    def __row_to_item(row, tags):
+        code, name, pdf, audio, page_num, extra = row
+        item = {'name': name}
+        if pdf is not None:
+            item['pdf'] = pdf
+        if audio is not None:
+            item['audio'] = audio
+        if tags:
+            item['tags'] = tags
+        if page_num is not None:
+            item['page_num'] = page_num
+        if extra:
+            item.update(json.loads(extra))
+        return item
@@ -0,0 +1,87 @@
+import threading
+from time import monotonic
+
+
+class Debouncer:
+    """
+    Coalesces bursts of calls: the function is called (on a timer thread) once there were no
+    new triggers for the given delay in seconds.
+    """
+
+    def __init__(self, delay, fn):
+        self.__delay = delay
+        self.__fn = fn
+        self.__timer = None
+        self.__lock = threading.Lock()
+
+    def trigger(self):
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+            self.__timer = threading.Timer(self.__delay, self.__fn)
+            self.__timer.daemon = True
+            self.__timer.start()
+
+    def cancel(self):
+        with self.__lock:
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+
+
+class Ticker:
+    """
+    Thread calling the function with a fixed rate (in Hz). It waits on a condition variable,
+    so it can be paused, resumed or stopped at once, and uses no CPU while paused.
+    """
+
+    def __init__(self, fn, rate, name='ticker'):
+        self.__fn = fn
+        self.__interval = 1.0 / rate
+        self.__paused = False
+        self.__terminated = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, name=name, daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def pause(self):
+        with self.__condition:
+            self.__paused = True
+            self.__condition.notify()
+
+    def resume(self):
+        with self.__condition:
+            self.__paused = False
+            self.__condition.notify()
+
+    def is_paused(self):
+        return self.__paused
+
+    def stop(self, wait_to_finish=True):
+        with self.__condition:
+            self.__terminated = True
+            self.__condition.notify()
+        if wait_to_finish and self.__thread.is_alive() and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+    def __run(self):
+        next_tick = monotonic()
+        while True:
+            with self.__condition:
+                while not self.__terminated:
+                    if self.__paused:
+                        self.__condition.wait()
+                        # restart ticking from the moment of resume
+                        next_tick = monotonic()
+                        continue
+                    timeout = next_tick - monotonic()
+                    if timeout <= 0:
+                        break
+                    self.__condition.wait(timeout)
+                if self.__terminated:
+                    return
+            self.__fn()
+            # fixed rate without drift, skipping ticks missed by a slow callback
+            next_tick = max(next_tick + self.__interval, monotonic())
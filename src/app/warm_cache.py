@@ -0,0 +1,57 @@
+import os
+from multiprocessing import Pool
+from time import perf_counter
+
+from .disk_cache import DiskRenderCache
+from .pdf import PdfDocument
+
+
+def warm_cache(documents, view_size=None, spreads=1, processes=None):
+    """
+    Pre-renders first spreads of all PDF entries into the persistent render cache, using a process pool.
+    By default pages are rendered for the last PDF panel size of the application.
+    """
+    view_size = view_size or DiskRenderCache().load_view_size()
+    if view_size is None:
+        raise Exception('Unknown page size, run the application once or pass the size explicitly')
+
+    jobs = {}
+    default_mode = documents.get_setting('render_mode', PdfDocument.RENDER_AUTO)
+    for code, item in documents.get_items().items():
+        if not item.get('pdf'):
+            continue
+        pdf_path = documents.expand_path(item['pdf'])
+        start_page_num = item.get('page_num', 0)
+        render_mode = item.get('render_mode') or default_mode
+        # entries may share the same PDF file and start page
+        jobs[(pdf_path, start_page_num, render_mode)] = (pdf_path, start_page_num, render_mode, tuple(view_size),
+                                                         spreads)
+
+    start = perf_counter()
+    rendered = 0
+    with Pool(processes) as pool:
+        for pdf_path, pages, elapsed, error in pool.imap_unordered(_warm_document, jobs.values()):
+            if error:
+                print(f'Failed {pdf_path}: {error}')
+            else:
+                rendered += pages
+                print(f'{pages} pages of {os.path.basename(pdf_path)} in {int(elapsed * 1000)} ms')
+    print(f'Rendered {rendered} pages of {len(jobs)} documents in {perf_counter() - start:.1f} s')
+
+
+def _warm_document(job):
+    pdf_path, start_page_num, render_mode, view_size, spreads = job
+    start = perf_counter()
+    try:
+        pdf = PdfDocument(pdf_path, render_mode=render_mode, disk_cache=DiskRenderCache())
+        pages = 0
+        pdf.go_to_page(start_page_num)
+        for _ in range(spreads):
+            for page_offset in (0, 1):
+                if pdf.get_pdf_page(view_size, page_offset=page_offset) is not None:
+                    pages += 1
+            pdf.next_page(step=2)
+        pdf.close()
+        return pdf_path, pages, perf_counter() - start, None
+    except Exception as ex:
+        return pdf_path, 0, perf_counter() - start, ex
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import struct
+
+import numpy as np
+import soundfile as sf
+
+
+class WaveformCache:
+    """
+    Waveform overviews of audio files: min/max peak pairs of a fixed number of bins, as signed bytes.
+    Peaks are computed once per file and stored in small binary files, which are memory-mapped when loaded.
+    Files keep modification time and size of the audio file, so changed files are computed again.
+    """
+    DEF_DIR = os.getenv('HOME') + '/.music-practice/waveforms'
+    BINS = 4096
+    BLOCK_FRAMES = 1024 * 1024
+    FILE_EXT = '.peaks'
+    HEADER = struct.Struct('<4sQQQII')
+    MAGIC = b'MPWF'
+
+    def __init__(self, directory=DEF_DIR):
+        self.__directory = directory
+
+    def get(self, path):
+        """Returns cached peaks of the file (array of bins x [min, max]) or None"""
+        stat = os.stat(path)
+        file_path = self.__file_path(path)
+        try:
+            with open(file_path, 'rb') as input_file:
+                header = input_file.read(WaveformCache.HEADER.size)
+            magic, mtime_ns, size, frames, sample_rate, bins = WaveformCache.HEADER.unpack(header)
+        except (OSError, struct.error):
+            return None
+        if magic != WaveformCache.MAGIC or mtime_ns != stat.st_mtime_ns or size != stat.st_size:
+            return None
+        return np.memmap(file_path, dtype=np.int8, mode='r', offset=WaveformCache.HEADER.size, shape=(bins, 2))
+
+    def compute(self, path):
+        """Decodes the file and stores its peaks"""
+        stat = os.stat(path)
+        with sf.SoundFile(path) as audio_file:
+            frames = audio_file.frames
+            sample_rate = audio_file.samplerate
+            peaks = WaveformCache.__compute_peaks(audio_file, frames)
+        file_path = self.__file_path(path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        tmp_path = f'{file_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as output_file:
+            output_file.write(WaveformCache.HEADER.pack(WaveformCache.MAGIC, stat.st_mtime_ns, stat.st_size, frames,
+                                                        sample_rate, len(peaks)))
+            output_file.write(peaks.tobytes())
+        os.replace(tmp_path, file_path)
+        return self.get(path)
+
+    def get_or_compute(self, path):
+        peaks = self.get(path)
+        return peaks if peaks is not None else self.compute(path)
+
+    @staticmethod
+    def __compute_peaks(audio_file, frames):
+        bins = WaveformCache.BINS
+        edges = np.linspace(0, max(frames, 1), bins + 1).astype(np.int64)
+        low = np.zeros(bins, dtype=np.int16)
+        high = np.zeros(bins, dtype=np.int16)
+        block_start = 0
+        for block in audio_file.blocks(blocksize=WaveformCache.BLOCK_FRAMES, dtype='int16', always_2d=True):
+            block_end = min(block_start + len(block), frames)
+            if block_end <= block_start:
+                break
+            block = block[:block_end - block_start]
+            # bins overlapping the block, partial bins at block edges are merged with the previous values
+            first = np.searchsorted(edges, block_start, side='right') - 1
+            last = np.searchsorted(edges, block_end, side='left')
+            starts = np.maximum(edges[first:last], block_start) - block_start
+            # reduce frames first and channels after, reductions along the short channel axis are slow
+            np.minimum(low[first:last], np.minimum.reduceat(block, starts, axis=0).min(axis=1), out=low[first:last])
+            np.maximum(high[first:last], np.maximum.reduceat(block, starts, axis=0).max(axis=1), out=high[first:last])
+            block_start = block_end
+        return np.stack((low >> 8, high >> 8), axis=1).astype(np.int8)
+
+    def __file_path(self, path):
+        name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()
+        return os.path.join(self.__directory, name + WaveformCache.FILE_EXT)
+
+    @staticmethod
+    def columns(peaks, count):
+        """Reduces peaks to the number of columns (e.g. pixels) as floats in -1..1"""
+        starts = np.linspace(0, len(peaks), count, endpoint=False).astype(np.int64)
+        low = np.minimum.reduceat(peaks[:, 0], starts)
+        high = np.maximum.reduceat(peaks[:, 1], starts)
+        return low / 128.0, high / 128.0
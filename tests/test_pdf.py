@@ -0,0 +1,41 @@
+import os
+import tempfile
+import threading
+import unittest
+
+import fitz
+
+from src.app.pdf import PdfDocument
+from src.app.render_cache import RenderCache
+
+VIEW_SIZE = (200, 280)
+TIMEOUT = 10
+
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'pages.pdf')
+        document = fitz.open()
+        for page_num in range(8):
+            document.new_page().insert_text((72, 72), f'Page {page_num}')
+        document.save(self.path)
+        document.close()
+        self.cache = RenderCache()
+        self.pdf = PdfDocument(self.path, self.cache, PdfDocument.RENDER_GRAY)
+
+    def tearDown(self):
+        self.pdf.close()
+        self.directory.cleanup()
+
+    def test_refine_is_finished_after_prerender(self):
+        refined = threading.Event()
+        self.pdf.refine(VIEW_SIZE, refined.set)
+        self.pdf.prerender(4, VIEW_SIZE)
+        self.assertTrue(refined.wait(TIMEOUT))
+        self.assertIsNotNone(self.pdf.get_pdf_page(VIEW_SIZE, cached_only=True))
+
+
+if __name__ == '__main__':
+    unittest.main()